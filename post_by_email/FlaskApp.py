@@ -12,21 +12,31 @@ logging.basicConfig(format=log_format, level=logging.WARN)
 # syslog_handler.setFormatter(logging.Formatter(log_format))
 
 import config
-from lib.EmailHandler import EmailHandler
+from lib.EmailHandler import EmailHandler, PostNotPublishedException
 
 import itsdangerous
 import hashlib
 
 import geopy
 import tinys3
-from lib.git import Git
+from lib.git import Git, PushRejectedException
+from lib.batching_geocoder import BatchingGeocoder
+from lib.site_index import SiteIndex
+from lib.resilience import Deadline, DeadlineExceededException, CircuitOpenException
+from lib.accounting import ResourceAccountant, OverBudgetException
 
-from flask import Flask, request
+from flask import Flask, request, jsonify
 app = Flask(__name__)
 logger = app.logger
 logger.setLevel(logging.DEBUG)
 
-geocoder = geopy.geocoders.OpenCage(config.OPENCAGE_API_KEY, timeout=5)
+geocoder = BatchingGeocoder(
+    geopy.geocoders.OpenCage(config.OPENCAGE_API_KEY, timeout=5),
+    precision=config.GEOCODE_PRECISION,
+    min_interval=config.OPENCAGE_MIN_INTERVAL,
+    rate_file=config.OPENCAGE_RATE_FILE,
+    cache_file=config.OPENCAGE_CACHE_FILE,
+)
 git = Git(config.GIT_REPO, config.GIT_WORKING_COPY)
 s3 = tinys3.Connection(
     config.AWS_ACCESS_KEY_ID,
@@ -35,9 +45,23 @@ s3 = tinys3.Connection(
     tls=True,
 )
 
-mail_handler = EmailHandler(s3, config.S3_IMAGE_PATH_PREFIX, geocoder, git, config.COMMIT_CHANGES)
+site_index = None
+if config.UPDATE_SITE_INDEX:
+    site_index = SiteIndex(config.GIT_WORKING_COPY)
+    git.use_union_merge(SiteIndex.PATTERNS)
+
+mail_handler = EmailHandler(s3, config.S3_IMAGE_PATH_PREFIX, geocoder, git, config.COMMIT_CHANGES, site_index)
+
+accountant = ResourceAccountant(
+    config.WORKER_MEMORY_BUDGET_MB * 1024 * 1024,
+    queue_timeout=config.ADMISSION_QUEUE_TIMEOUT,
+)
+
 signer = itsdangerous.Signer(config.ADDR_VALIDATION_HMAC_KEY, sep="^", digest_method=hashlib.sha256)
 
+## salted differently so that a stats token can't be used as an address hash, or vice versa
+stats_signer = itsdangerous.Signer(config.ADDR_VALIDATION_HMAC_KEY, salt="stats", sep="^", digest_method=hashlib.sha256)
+
 
 @app.route("/email/<sender>/<addr_hash>", methods=["POST"])
 def upload_email(sender, addr_hash):
@@ -48,12 +72,38 @@ def upload_email(sender, addr_hash):
         
         return "invalid hash", 403, {"Content-Type": "text/plain; charset=utf-8"}
     
-    post_path = mail_handler.process_stream(request.stream)
+    deadline = Deadline(config.REQUEST_DEADLINE)
+    
+    ## the message is parsed in memory, so its size drives the memory needed
+    estimated_bytes = (request.content_length or config.DEFAULT_REQUEST_SIZE) * config.REQUEST_MEMORY_FACTOR
+    
+    try:
+        with accountant.admit(estimated_bytes, deadline) as usage:
+            post_path = mail_handler.process_stream(request.stream, deadline, usage)
+    except (
+        DeadlineExceededException, CircuitOpenException, OverBudgetException,
+        PushRejectedException, PostNotPublishedException,
+    ), e:
+        ## nothing was published, and resending will work once things settle down
+        logger.error("unable to process request from %s: %r", sender, e)
+        
+        return "service unavailable", 503, {"Content-Type": "text/plain; charset=utf-8"}
 
     logger.info("successfully created %s", post_path)
     return post_path, 201, {"Content-Type": "text/plain; charset=utf-8"}
 
 
+@app.route("/stats/<token>", methods=["GET"])
+def stats(token):
+    if not stats_signer.validate("^".join(["stats", token])):
+        logger.warn("invalid stats token")
+        
+        return "invalid token", 403, {"Content-Type": "text/plain; charset=utf-8"}
+    
+    ## per worker process; poll repeatedly to see them all
+    return jsonify(accountant.stats())
+
+
 if __name__ == "__main__":
     logger.info("ready")
     app.run()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+## compares memory and time for decoding the JPEG in test-fixtures/photo-1.msg.gz
+## with lib.base64_stream against decoding the whole payload up front.  each
+## mode runs in its own process, starting from just the encoded attachment, so
+## parsing the message doesn't mask the peak RSS of decoding it.
+## usage: ./bench_base64_stream.py [iterations]
+
+import sys
+import os
+import gzip
+import email
+import email.message
+import subprocess
+import tempfile
+import time
+
+from lib.accounting import current_rss, peak_rss
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test-fixtures", "photo-1.msg.gz")
+
+MODES = ["get_payload", "base64_stream"]
+
+
+def extract_payload(fn):
+    """writes the still-encoded JPEG attachment from the fixture to fn"""
+    with gzip.open(FIXTURE, "r") as ifp:
+        msg = email.message_from_file(ifp)
+
+    for part in msg.walk():
+        if part.get_content_type() == "image/jpeg":
+            with open(fn, "w") as ofp:
+                ofp.write(part.get_payload())
+
+            return
+
+
+def jpeg_part(fn):
+    part = email.message.Message()
+    part["Content-Type"] = "image/jpeg"
+    part["Content-Transfer-Encoding"] = "base64"
+
+    with open(fn, "r") as ifp:
+        part.set_payload(ifp.read())
+
+    return part
+
+
+def open_photo(mode, part):
+    if mode == "get_payload":
+        import StringIO
+        return StringIO.StringIO(part.get_payload(decode=True))
+
+    import lib.base64_stream as base64_stream
+    return base64_stream.open_part(part)
+
+
+def run_mode(mode, payload_fn, number):
+    import lib.exif_renderer as exif_renderer
+
+    part = jpeg_part(payload_fn)
+
+    start_rss = current_rss()
+    start_peak = peak_rss()
+    start = time.time()
+
+    for _ in range(number):
+        ## what EmailHandler does: render EXIF, then stream the body to S3
+        photo_io = open_photo(mode, part)
+        exif_renderer.render_stream(photo_io)
+
+        photo_io.seek(0)
+        while photo_io.read(8192):
+            pass
+
+        photo_io.close()
+        del photo_io
+
+    elapsed = time.time() - start
+
+    ## peak growth beyond whatever parsing the message already needed
+    peak_delta = peak_rss() - max(start_peak, start_rss)
+
+    print "%-14s %8.2f ms/msg %8.1f KB peak RSS growth" % (mode, elapsed / number * 1e3, peak_delta / 1024.0)
+
+
+def main(number=20):
+    fd, payload_fn = tempfile.mkstemp(suffix=".b64")
+    os.close(fd)
+
+    try:
+        extract_payload(payload_fn)
+
+        for mode in MODES:
+            subprocess.check_call([sys.executable, __file__, "--mode", mode, payload_fn, str(number)])
+    finally:
+        os.remove(payload_fn)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["--mode"]:
+        run_mode(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+    else:
+        main(*sys.argv[1:])
@@ -0,0 +1,30 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+## micro-benchmark for the date parsing fast paths in lib.time_util
+## usage: ./bench_time_util.py [iterations]
+
+import sys
+import timeit
+
+
+def main(number=100000):
+    number = int(number)
+
+    for label, stmt in [
+        ("parse_date (fast path)",  'parse_date("Sun, 5 Jul 2015 07:28:43 -0400")'),
+        ("parse_date (email.utils)", '_parse_date_email_utils("Sun, 5 Jul 2015 07:28:43 -0400")'),
+        ("parse_exif_datetime",     'parse_exif_datetime("2015:07:03 23:39:33")'),
+        ("datetime.strptime",       'datetime.datetime.strptime("2015:07:03 23:39:33", "%Y:%m:%d %H:%M:%S")'),
+    ]:
+        elapsed = timeit.timeit(
+            stmt,
+            setup="import datetime; from lib.time_util import parse_date, _parse_date_email_utils, parse_exif_datetime",
+            number=number,
+        )
+
+        print "%-26s %8.2f µs/call" % (label, elapsed / number * 1e6)
+
+
+if __name__ == "__main__":
+    main(*sys.argv[1:])
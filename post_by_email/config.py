@@ -13,6 +13,28 @@ GIT_REPO = os.environ["GIT_REPO"]
 GIT_WORKING_COPY = os.environ["GIT_WORKING_COPY"]
 
 GIT_COMMITTER_NAME = os.environ.get("GIT_COMMITTER_NAME", "post by email")
+GIT_COMMITTER_EMAIL = os.environ.get("GIT_COMMITTER_EMAIL", "post-by-email@localhost")
+
+## seconds a request has to finish all of its external calls; must be less than
+## gunicorn's --timeout
+REQUEST_DEADLINE = float(os.environ.get("REQUEST_DEADLINE", "150"))
+
+## memory each worker process may commit to requests at once; requests that
+## would exceed it wait up to ADMISSION_QUEUE_TIMEOUT seconds, then get a 503.
+## also used to size the number of workers; see gunicorn_config.py
+WORKER_MEMORY_BUDGET_MB = int(os.environ.get("WORKER_MEMORY_BUDGET_MB", "256"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "30"))
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "4"))
+
+## a request is assumed to need this many times its size in memory; the raw
+## message and the parsed parts both stay resident
+REQUEST_MEMORY_FACTOR = int(os.environ.get("REQUEST_MEMORY_FACTOR", "3"))
+
+## assumed size of requests without a Content-Length
+DEFAULT_REQUEST_SIZE = int(os.environ.get("DEFAULT_REQUEST_SIZE", str(16 * 1024 * 1024)))
+
+## maintain _data/photos.csv and _data/tags.csv in the blog repo along with each post
+UPDATE_SITE_INDEX = os.environ.get("UPDATE_SITE_INDEX", "True").lower() == "true"
 
 ## http://hipsterdevblog.com/blog/2014/06/22/lazy-processing-images-using-s3-and-redirection-rules/
 ## https://github.com/thumbor/thumbor/wiki
@@ -27,3 +49,18 @@ AWS_SECRET_ACCESS_KEY = os.environ["AWS_SECRET_ACCESS_KEY"]
 ## reverse geocoding service
 ## http://geocoder.opencagedata.com/demo.html
 OPENCAGE_API_KEY = os.environ["OPENCAGE_API_KEY"]
+
+## reverse lookups for points rounded to the same number of decimal places
+## share a single request; 3 is roughly 100m
+GEOCODE_PRECISION = int(os.environ.get("GEOCODE_PRECISION", "3"))
+
+## seconds between requests; the free tier allows 1 per second
+OPENCAGE_MIN_INTERVAL = float(os.environ.get("OPENCAGE_MIN_INTERVAL", "1.0"))
+
+## time of the last request, shared by every process that calls the provider
+## (each gunicorn worker, and reprocess_posts.py) so the interval holds across them
+OPENCAGE_RATE_FILE = os.environ.get("OPENCAGE_RATE_FILE", os.path.join(GIT_WORKING_COPY, ".git", "opencage-rate"))
+
+## recent results, shared the same way so that nearby points looked up by one
+## worker aren't looked up again by another
+OPENCAGE_CACHE_FILE = os.environ.get("OPENCAGE_CACHE_FILE", os.path.join(GIT_WORKING_COPY, ".git", "opencage-cache.json"))
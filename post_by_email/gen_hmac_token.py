@@ -6,9 +6,11 @@ import itsdangerous
 import hashlib
 
 
-def main(secret_key, email_addr):
+## usage: ./gen_hmac_token.py <secret key> <email address>
+##        ./gen_hmac_token.py <secret key> stats stats    (token for GET /stats/<token>)
+def main(secret_key, email_addr, salt=None):
     sep = "^"
-    signer = itsdangerous.Signer(secret_key, sep=sep, digest_method=hashlib.sha256)
+    signer = itsdangerous.Signer(secret_key, salt=salt, sep=sep, digest_method=hashlib.sha256)
     
     print signer.sign(email_addr).split(sep, 2)[1]
     
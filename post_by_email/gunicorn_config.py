@@ -0,0 +1,57 @@
+# -*- encoding: utf-8 -*-
+
+## gunicorn settings; sizes the worker pool to the memory and cores available,
+## so that every worker can use its full WORKER_MEMORY_BUDGET_MB without the
+## container running out of memory.
+
+import os
+import sys
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import config
+
+## interpreter, flask, etc. before any requests are handled
+WORKER_BASE_MB = 64
+
+## leave some room for the master, git and everything else in the container
+MEMORY_HEADROOM = 0.8
+
+
+def available_memory():
+    """bytes of memory available to this container"""
+    limits = []
+
+    with open("/proc/meminfo", "r") as ifp:
+        for line in ifp:
+            if line.startswith("MemTotal:"):
+                limits.append(int(line.split()[1]) * 1024)
+
+    ## docker memory limit, if any
+    for fn in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        if os.path.exists(fn):
+            with open(fn, "r") as ifp:
+                value = ifp.read().strip()
+
+            if value.isdigit():
+                limits.append(int(value))
+
+    return min(limits)
+
+
+def worker_count():
+    by_cpu = multiprocessing.cpu_count() * 2 + 1
+    by_memory = int(available_memory() * MEMORY_HEADROOM // ((WORKER_BASE_MB + config.WORKER_MEMORY_BUDGET_MB) * 1024 * 1024))
+
+    return max(1, min(by_cpu, by_memory))
+
+
+workers = worker_count()
+threads = config.WORKER_THREADS
+
+
+def when_ready(server):
+    server.log.info(
+        "%d workers with %d threads and a %dMB memory budget each",
+        workers, threads, config.WORKER_MEMORY_BUDGET_MB,
+    )
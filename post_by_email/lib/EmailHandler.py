@@ -3,15 +3,18 @@
 import logging
 import os
 import email.header
-import StringIO
 import codecs
 import re
 
 from slugify import slugify
-import rtyaml as yaml
+import geopy.exc
 
 from lib.time_util import parse_date, UTC
 import lib.exif_renderer as exif_renderer
+import lib.base64_stream as base64_stream
+import lib.deadline_s3 as deadline_s3
+from lib.post import write_post
+from lib.resilience import Deadline, DeadlineReader, DeadlineExceededException, CircuitBreaker, CircuitOpenException
 from collections import OrderedDict
 
 
@@ -25,7 +28,8 @@ class PostExistsException(Exception):
     pass
 
 
-class ImageExistsException(Exception):
+class PostNotPublishedException(Exception):
+    """post was committed, but dropped before it could be pushed"""
     pass
 
 
@@ -33,8 +37,11 @@ class EmailHandler(object):
     """Generates Jekyll post from an email, possibly with attachments"""
 
     SIG_DELIMITER = re.compile(r"""^(--\s*|Sent from my iPhone)$""", re.IGNORECASE)
+    
+    ## upper bound on a single reverse geocoding request when under a deadline
+    GEOCODE_TIMEOUT = 5
 
-    def __init__(self, s3, s3_prefix, geocoder, git, commit_changes=False):
+    def __init__(self, s3, s3_prefix, geocoder, git, commit_changes=False, site_index=None):
         super(EmailHandler, self).__init__()
         
         self.logger = logging.getLogger(self.__class__.__name__)
@@ -44,55 +51,108 @@ class EmailHandler(object):
         self.geocoder = geocoder
         self.git = git
         self.commit_changes = commit_changes
+        
+        ## optional lib.site_index.SiteIndex, updated alongside each post
+        self.site_index = site_index
+        
+        ## stop calling a dependency that keeps failing, instead of tying up
+        ## workers waiting on it
+        self.breakers = {
+            "s3": CircuitBreaker("s3"),
+            "geocoder": CircuitBreaker("geocoder"),
+            "git": CircuitBreaker("git"),
+        }
+    
+    def __geocode(self, location, deadline):
+        """
+        Returns the name for the location, or None if there isn't one or if the
+        geocoder is slow or unavailable; in that case the post is published
+        without the name, to be backfilled later.
+        """
+        point = [location["latitude"], location["longitude"]]
+        
+        try:
+            timeout = deadline.timeout(what="reverse geocoding")
+            kwargs = {} if timeout is None else {"timeout": min(timeout, self.GEOCODE_TIMEOUT)}
+            
+            with self.breakers["geocoder"]:
+                loc = self.geocoder.reverse(point, exactly_one=True, **kwargs)
+        except (geopy.exc.GeopyError, DeadlineExceededException, CircuitOpenException), e:
+            self.logger.warn("reverse geocoding unavailable for %r; publishing without location name: %r", tuple(point), e)
+            return None
+        
+        if not loc:
+            self.logger.warn("no reverse geocoding result found for %r", tuple(point))
+            return None
+        
+        return loc.address
     
-    def __process_image(self, slug, photo):
+    def __process_image(self, slug, photo, deadline, usage):
         img_info = OrderedDict()
         s3_obj_name = os.path.join(self.s3_prefix, slug, photo.get_filename())
 
-        ## abort if image already exists
-        if [k for k in self.s3.list(s3_obj_name)]:
-            raise ImageExistsException(s3_obj_name)
+        ## the post hasn't been published (that's checked first), so an
+        ## existing image was left by an earlier attempt whose push failed;
+        ## replace it so that resending the email works
+        with self.breakers["s3"]:
+            existing = [k for k in deadline_s3.list_keys(self.s3, s3_obj_name, deadline)]
+        
+        if existing:
+            self.logger.warn("replacing %s left by an earlier attempt", s3_obj_name)
         
         img_info["path"] = s3_obj_name
 
         self.logger.debug("processing %s", s3_obj_name)
 
-        photo_io = StringIO.StringIO(photo.get_payload(decode=True))
+        ## decode the attachment on demand instead of materializing it; the EXIF
+        ## reader only needs the header, and the upload streams the rest
+        photo_io = base64_stream.open_part(photo)
         img_info["exif"] = exif_renderer.render_stream(photo_io)
         
         ## get image location name with opencagedata
-        loc = self.geocoder.reverse(
-            [img_info["exif"]["location"]["latitude"], img_info["exif"]["location"]["longitude"]],
-            exactly_one=True,
-        )
+        loc_name = self.__geocode(img_info["exif"]["location"], deadline)
         
-        if loc:
+        if loc_name:
             ## @todo set image timezone from location?
-            img_info["exif"]["location"]["name"] = loc.address
-        else:
-            self.logger.warn("no reverse geocoding result found for %r", (img_info["exif"]["location"]["latitude"], img_info["exif"]["location"]["longitude"]))
+            img_info["exif"]["location"]["name"] = loc_name
         
         ## upload image to s3
         self.logger.debug("uploading to S3: %s", s3_obj_name)
 
-        self.s3.upload(
-            s3_obj_name,
-            photo_io,
-            content_type="image/jpeg",  # @todo
-            close=True,  # close file afterwards
-            rewind=True,  # defaults to True, but just in case…
-        )
+        ## the request's timeout covers connecting and waiting for the
+        ## response; reading the body fails once the deadline passes
+        with self.breakers["s3"]:
+            deadline_s3.upload(
+                self.s3,
+                s3_obj_name,
+                DeadlineReader(photo_io, deadline, "S3 upload"),
+                deadline,
+                content_type="image/jpeg",  # @todo
+                close=True,  # close file afterwards
+                rewind=True,  # defaults to True, but just in case…
+            )
 
         self.logger.info("uploaded %s to S3", s3_obj_name)
         
+        if usage is not None:
+            usage.decoded_bytes += photo_io.len
+        
         return img_info
     
-    def process_stream(self, stream):
-        return self.process_message(email.message_from_file(stream))
+    def process_stream(self, stream, deadline=None, usage=None):
+        return self.process_message(email.message_from_file(stream), deadline, usage)
     
-    def process_message(self, msg):
+    def process_message(self, msg, deadline=None, usage=None):
+        """
+        Generates, commits and pushes the post.  `deadline` is a
+        lib.resilience.Deadline that external calls must finish by; `usage` is
+        an optional lib.accounting.RequestUsage to record decoded bytes in.
+        """
         self.logger.debug("%s from %s to %s: %s", msg["message-id"], msg["from"], msg["to"], msg["subject"])
         
+        if deadline is None:
+            deadline = Deadline()
+        
         msg_date = parse_date(msg["Date"])
         
         ## group the parts by type
@@ -127,8 +187,15 @@ class EmailHandler(object):
 
         post_rel_fn = slug + ".md"
         post_full_fn = os.path.join(self.git.repo_path, "_posts", "blog", post_rel_fn)
+        post_repo_fn = os.path.relpath(post_full_fn, self.git.repo_path)
+        
+        if self.commit_changes:
+            ## the working copy is only brought up to date when a push has to
+            ## be rebased, so check what's been published as well
+            with self.breakers["git"]:
+                self.git.fetch(timeout=deadline.timeout(what="git fetch"))
         
-        if os.path.exists(post_full_fn):
+        if os.path.exists(post_full_fn) or (self.commit_changes and self.git.exists_upstream(post_repo_fn)):
             raise PostExistsException(post_rel_fn)
 
         ## strip signature from body
@@ -162,48 +229,65 @@ class EmailHandler(object):
             fm["tags"].append("photo")
             fm["images"] = []
             for photo in msg_parts["image/jpeg"]:
-                fm["images"].append(self.__process_image(slug, photo))
+                fm["images"].append(self.__process_image(slug, photo, deadline, usage))
+        
+        ## last chance to give up before anything is written
+        deadline.check("git commit")
+        if self.commit_changes and self.breakers["git"].is_open:
+            raise CircuitOpenException("git")
         
         self.logger.debug("generating %s", post_full_fn)
 
-        with self.git.lock():
-            if self.commit_changes:
-                ## make the current master the same as the origin's master
-                self.git.clean_sweep()
-            
+        ## only local operations happen under the lock; we don't fetch before
+        ## committing, and instead rebase and retry if the push is rejected.
+        with self.git.lock(wait=deadline.timeout(30, what="git lock")):
             ## @todo consider making every change a PR and automatically approving them
 
-            if not os.path.exists(os.path.dirname(post_full_fn)):
-                os.makedirs(os.path.dirname(post_full_fn))
+            ## a concurrent request for the same post may have got here first
+            if os.path.exists(post_full_fn):
+                raise PostExistsException(post_rel_fn)
             
-            with codecs.open(post_full_fn, "w", encoding="utf-8") as ofp:
-                ## I *want* to use yaml, but I can't get it to properly to encode
-                ## "Test 🔫"; kept getting "Test \uD83D\uDD2B" which the Go yaml parser
-                ## bitched about.
-                ## but I'm not hitched to hugo, yet, and yaml is what jekyll uses, so…
-                ofp.write("---\n")
+            try:
+                if not os.path.exists(os.path.dirname(post_full_fn)):
+                    os.makedirs(os.path.dirname(post_full_fn))
                 
-                ## hack for title which the yaml generator won't do properly
-                ofp.write('title: "%s"\n' % fm["title"])
-                del fm["title"]
-                yaml.dump(frontmatter, ofp)
-
-                ## we want an space between the frontmatter and the body
-                ofp.write("---\n\n")
-                ofp.write(body)
-            
-            self.logger.info("generated %s", post_rel_fn)
-            
-            if self.commit_changes:
-                ## add the new file
-                self.git.add_file(post_full_fn)
+                with codecs.open(post_full_fn, "w", encoding="utf-8") as ofp:
+                    write_post(ofp, frontmatter, body)
                 
-                ## commit the change
-                self.git.commit(author_name, fm["author"], msg["date"], post_title)
+                self.logger.info("generated %s", post_rel_fn)
                 
-                ## push the change
-                self.git.push()
-            else:
-                self.logger.warn("not committing changes")
+                changed_files = [post_full_fn]
+                if self.site_index is not None:
+                    changed_files.extend(self.site_index.add_post(post_repo_fn, fm))
+                
+                if self.commit_changes:
+                    ## add the new file, and any updated indexes
+                    self.git.add_file(*changed_files)
+                    
+                    ## commit the change
+                    self.git.commit(author_name, fm["author"], msg["date"], post_title)
+                else:
+                    self.logger.warn("not committing changes")
+            except Exception:
+                ## don't leave a half-written post or index rows behind; they'd
+                ## block a resend and be committed along with the next post
+                self.logger.error("unable to commit %s; discarding changes", post_rel_fn)
+                
+                if self.commit_changes:
+                    self.git.discard_changes()
+                elif os.path.exists(post_full_fn):
+                    os.remove(post_full_fn)
+                
+                raise
+        
+        if self.commit_changes:
+            ## push the change, outside of the lock
+            with self.breakers["git"]:
+                self.git.push_with_retry(deadline)
+            
+            ## another worker's failed push may have reset the branch before
+            ## ours went out
+            if not self.git.exists_upstream(post_repo_fn):
+                raise PostNotPublishedException(post_rel_fn)
         
         return post_rel_fn
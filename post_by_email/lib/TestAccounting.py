@@ -0,0 +1,88 @@
+# -*- encoding: utf-8 -*-
+
+from accounting import ResourceAccountant, OverBudgetException
+from resilience import Deadline
+
+from nose.tools import eq_, ok_, raises
+import threading
+import time
+
+
+class TestResourceAccountant:
+    def setup(self):
+        self.accountant = ResourceAccountant(100, queue_timeout=0.2)
+
+    def test_recordsUsage(self):
+        with self.accountant.admit(60) as usage:
+            usage.decoded_bytes = 1234
+            eq_(self.accountant.stats()["reserved"], 60)
+            eq_(self.accountant.stats()["active"], 1)
+
+        stats = self.accountant.stats()
+        eq_(stats["reserved"], 0)
+        eq_(stats["active"], 0)
+        eq_(stats["admitted"], 1)
+        eq_(stats["totals"]["decoded_bytes"], 1234)
+        eq_(stats["max"]["estimated_bytes"], 60)
+
+        eq_(len(stats["recent"]), 1)
+        ok_(stats["recent"][0]["wall_time"] >= 0)
+        ok_(stats["recent"][0]["cpu_time"] >= 0)
+        ok_(stats["recent"][0]["rss_delta"] is not None)
+
+    def test_releasesOnError(self):
+        try:
+            with self.accountant.admit(60):
+                raise ValueError("boom")
+        except ValueError:
+            pass
+
+        eq_(self.accountant.stats()["reserved"], 0)
+
+    @raises(OverBudgetException)
+    def test_rejectsRequestLargerThanBudget(self):
+        try:
+            with self.accountant.admit(101):
+                pass
+        finally:
+            eq_(self.accountant.stats()["rejected"], 1)
+
+    @raises(OverBudgetException)
+    def test_rejectsWhenBudgetStaysFull(self):
+        with self.accountant.admit(60):
+            with self.accountant.admit(60):
+                pass
+
+    def test_queuesUntilThereIsRoom(self):
+        admitted = threading.Event()
+
+        def second():
+            with self.accountant.admit(60):
+                admitted.set()
+
+        with self.accountant.admit(60):
+            t = threading.Thread(target=second)
+            t.start()
+
+            time.sleep(0.05)
+            ok_(not admitted.is_set())
+            eq_(self.accountant.stats()["queued"], 1)
+
+        t.join()
+        ok_(admitted.is_set())
+
+        stats = self.accountant.stats()
+        eq_(stats["admitted"], 2)
+        ok_(stats["recent"][1]["queued_time"] > 0)
+
+    @raises(OverBudgetException)
+    def test_queueingRespectsDeadline(self):
+        self.accountant.queue_timeout = 60
+
+        with self.accountant.admit(60):
+            start = time.time()
+            try:
+                with self.accountant.admit(60, Deadline(0.1)):
+                    pass
+            finally:
+                ok_(time.time() - start < 5)
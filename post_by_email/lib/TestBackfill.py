@@ -0,0 +1,185 @@
+# -*- encoding: utf-8 -*-
+
+from backfill import Backfill
+from post import read_post, write_post
+from site_index import SiteIndex
+
+from nose.tools import eq_, ok_
+import mock
+import os
+import codecs
+import shutil
+import tempfile
+import gzip
+import email
+import geopy
+import geopy.exc
+import tinys3
+from collections import OrderedDict
+
+
+class TestBackfill:
+    FIXTURE_DIR = os.path.abspath(os.path.join(__file__, "../../test-fixtures"))
+
+    def setup(self):
+        self.git_repo_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.git_repo_dir, ".git"))
+
+        self.mock_s3 = mock.create_autospec(tinys3.Connection, instance=True)
+        self.mock_s3.auth = mock.sentinel.auth
+        self.mock_s3.tls = True
+        self.mock_s3.endpoint = "s3.amazonaws.com"
+        self.mock_s3.bucket.return_value = "images"
+
+        ## mock of geopy.geocoders.OpenCage
+        self.mock_geocoder = mock.Mock()
+        self.mock_geocoder.reverse.return_value = geopy.location.Location("the park", geopy.location.Point(42.347, -71.096, 0))
+
+        ## mock of lib.git.Git
+        self.mock_git = mock.Mock()
+        self.mock_git.repo_path = self.git_repo_dir
+        self.mock_git.lock = mock.MagicMock()
+
+        self.backfill = Backfill(self.mock_s3, self.mock_geocoder, self.mock_git, commit_changes=True, batch_size=2, s3_interval=0)
+
+    def teardown(self):
+        shutil.rmtree(self.git_repo_dir)
+
+    def __post_fn(self, slug):
+        return os.path.join(self.git_repo_dir, "_posts", "blog", slug + ".md")
+
+    def __write_post(self, slug, location_name=None):
+        location = OrderedDict([("latitude", 42.347011111111115), ("longitude", -71.09632222222221)])
+        if location_name:
+            location["name"] = location_name
+
+        fm = OrderedDict()
+        fm["date"] = "2015-07-05T07:28:43-04:00"
+        fm["title"] = u"post " + slug
+        fm["layout"] = "post"
+        fm["tags"] = ["photo"]
+        fm["images"] = [OrderedDict([
+            ("path", "img/email/%s/IMG_5810.JPG" % slug),
+            ("exif", OrderedDict([("dateTimeOriginal", "2015-07-03T23:39:33"), ("location", location)])),
+        ])]
+
+        if not os.path.exists(os.path.dirname(self.__post_fn(slug))):
+            os.makedirs(os.path.dirname(self.__post_fn(slug)))
+
+        with codecs.open(self.__post_fn(slug), "w", encoding="utf-8") as ofp:
+            write_post(ofp, fm, u"body of " + slug)
+
+    def __read_post(self, slug):
+        with codecs.open(self.__post_fn(slug), "r", encoding="utf-8") as ifp:
+            return read_post(ifp)
+
+    def test_fillsMissingLocationNames(self):
+        self.__write_post("2015-07-01-a")
+        self.__write_post("2015-07-02-b", location_name=u"somewhere")
+        self.__write_post("2015-07-03-c")
+
+        self.backfill.run()
+
+        eq_(self.__read_post("2015-07-01-a")[0]["images"][0]["exif"]["location"]["name"], "the park")
+        eq_(self.__read_post("2015-07-02-b")[0]["images"][0]["exif"]["location"]["name"], "somewhere")
+        eq_(self.__read_post("2015-07-03-c")[0]["images"][0]["exif"]["location"]["name"], "the park")
+        eq_(self.__read_post("2015-07-03-c")[1], u"body of 2015-07-03-c")
+
+        ## one commit per batch with changes
+        eq_(self.mock_git.commit.call_count, 2)
+        self.mock_git.add_file.assert_any_call(self.__post_fn("2015-07-01-a"))
+        eq_(self.mock_git.push_with_retry.call_count, 2)
+
+        ## finished, so there's nothing to resume
+        ok_(not os.path.exists(self.backfill.checkpoint_path))
+
+    def test_leavesPostAloneWhenGeocoderFails(self):
+        self.__write_post("2015-07-01-a")
+        with open(self.__post_fn("2015-07-01-a"), "r") as ifp:
+            before = ifp.read()
+
+        self.mock_geocoder.reverse.side_effect = geopy.exc.GeocoderTimedOut("slow")
+        self.backfill.run()
+
+        with open(self.__post_fn("2015-07-01-a"), "r") as ifp:
+            eq_(ifp.read(), before)
+
+        ok_(not self.mock_git.commit.called)
+
+    def test_resumesFromCheckpoint(self):
+        self.__write_post("2015-07-01-a")
+        self.__write_post("2015-07-02-b")
+        self.__write_post("2015-07-03-c")
+
+        self.backfill.write_checkpoint("2015-07-02-b.md")
+        eq_(self.backfill.pending_posts(), ["2015-07-03-c.md"])
+
+        self.backfill.run()
+
+        ok_("name" not in self.__read_post("2015-07-01-a")[0]["images"][0]["exif"]["location"])
+        eq_(self.__read_post("2015-07-03-c")[0]["images"][0]["exif"]["location"]["name"], "the park")
+
+    def test_doesNotCheckpointPastFailures(self):
+        self.__write_post("2015-07-01-a")
+        self.__write_post("2015-07-02-b")
+        self.__write_post("2015-07-03-c")
+
+        def reverse(point, exactly_one):
+            if self.mock_geocoder.reverse.call_count == 2:
+                raise ValueError("unexpected")
+
+            return geopy.location.Location("the park", geopy.location.Point(42.347, -71.096, 0))
+
+        self.mock_geocoder.reverse.side_effect = reverse
+        self.backfill.workers = 1
+
+        eq_(self.backfill.run(), ["2015-07-02-b.md"])
+
+        ## the posts either side were still updated
+        eq_(self.__read_post("2015-07-01-a")[0]["images"][0]["exif"]["location"]["name"], "the park")
+        eq_(self.__read_post("2015-07-03-c")[0]["images"][0]["exif"]["location"]["name"], "the park")
+
+        eq_(self.backfill.read_checkpoint(), "2015-07-01-a.md")
+        eq_(self.backfill.pending_posts(), ["2015-07-02-b.md", "2015-07-03-c.md"])
+
+    def test_refreshesExifFromS3Header(self):
+        self.__write_post("2015-07-01-a", location_name=u"somewhere")
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            msg = email.message_from_file(ifp)
+
+        jpeg = [p for p in msg.walk() if p.get_content_type() == "image/jpeg"][0].get_payload(decode=True)
+
+        self.backfill.refresh_exif = True
+
+        with mock.patch("requests.get") as mock_get:
+            mock_get.return_value.content = jpeg[:Backfill.EXIF_HEADER_BYTES]
+
+            self.backfill.run()
+
+        eq_(mock_get.call_args[0][0], "https://s3.amazonaws.com/images/img/email/2015-07-01-a/IMG_5810.JPG")
+        eq_(mock_get.call_args[1]["auth"], mock.sentinel.auth)
+        eq_(mock_get.call_args[1]["headers"], {"Range": "bytes=0-131071"})
+
+        exif = self.__read_post("2015-07-01-a")[0]["images"][0]["exif"]
+        eq_(exif["cameraModel"], "iPhone 6")
+        eq_(exif["dateTimeGps"], "2015-07-04T03:39:33+00:00")
+
+        ## existing name is kept rather than looked up again
+        eq_(exif["location"]["name"], "somewhere")
+        ok_(not self.mock_geocoder.reverse.called)
+
+    def test_updatesSiteIndex(self):
+        self.__write_post("2015-07-01-a")
+
+        self.backfill.site_index = SiteIndex(self.git_repo_dir)
+
+        ## as recorded when the post was first ingested, without a name
+        self.backfill.site_index.add_post("_posts/blog/2015-07-01-a.md", self.__read_post("2015-07-01-a")[0])
+
+        self.backfill.run()
+
+        photos = self.backfill.site_index.photos.read()
+        eq_(len(photos), 1)
+        eq_(photos[0]["name"], "the park")
+        self.mock_git.add_file.assert_called_once_with(self.__post_fn("2015-07-01-a"), self.backfill.site_index.photos.path)
@@ -0,0 +1,66 @@
+# -*- encoding: utf-8 -*-
+
+from base64_stream import Base64DecodingStream, open_part
+
+from nose.tools import eq_, ok_
+import base64
+import random
+import StringIO
+from email.mime.image import MIMEImage
+from email.mime.text import MIMEText
+
+
+class TestBase64DecodingStream:
+    def setup(self):
+        rand = random.Random(42)
+        self.raw = "".join(chr(rand.randint(0, 255)) for _ in range(300 * 1024 + 7))
+        self.stream = Base64DecodingStream(base64.encodestring(self.raw), header_size=1024)
+
+    def test_length(self):
+        eq_(self.stream.len, len(self.raw))
+        eq_(Base64DecodingStream("").len, 0)
+        eq_(Base64DecodingStream(base64.encodestring("ab")).len, 2)
+        eq_(Base64DecodingStream(base64.encodestring("a") + "\r\n\r\n").len, 1)
+        eq_(Base64DecodingStream(base64.encodestring("abc")).len, 3)
+
+    def test_readAll(self):
+        eq_(self.stream.read(), self.raw)
+        eq_(self.stream.read(), "")
+
+    def test_readInBlocks(self):
+        blocks = []
+        while True:
+            block = self.stream.read(8192)
+            if not block:
+                break
+
+            ok_(len(block) <= 8192)
+            blocks.append(block)
+
+        eq_("".join(blocks), self.raw)
+
+    def test_seekAround(self):
+        rand = random.Random(7)
+        for _ in range(200):
+            pos = rand.randint(0, len(self.raw) + 10)
+            size = rand.randint(0, 100 * 1024)
+
+            self.stream.seek(pos)
+            eq_(self.stream.read(size), self.raw[pos:pos + size])
+            eq_(self.stream.tell(), min(pos + size, max(pos, len(self.raw))))
+
+    def test_seekRelative(self):
+        self.stream.seek(10)
+        self.stream.seek(5, 1)
+        eq_(self.stream.read(3), self.raw[15:18])
+
+        self.stream.seek(-4, 2)
+        eq_(self.stream.read(), self.raw[-4:])
+
+    def test_openPart(self):
+        ok_(isinstance(open_part(MIMEImage(self.raw, "jpeg")), Base64DecodingStream))
+        eq_(open_part(MIMEImage(self.raw, "jpeg")).read(), self.raw)
+
+        part = open_part(MIMEText("just text"))
+        ok_(isinstance(part, StringIO.StringIO))
+        eq_(part.read(), "just text")
@@ -0,0 +1,126 @@
+# -*- encoding: utf-8 -*-
+
+from batching_geocoder import BatchingGeocoder
+from resilience import DeadlineExceededException
+
+from nose.tools import eq_, ok_, raises
+import mock
+import os
+import shutil
+import tempfile
+import threading
+import time
+import geopy
+
+
+class TestBatchingGeocoder:
+    def setup(self):
+        ## mock of geopy.geocoders.OpenCage
+        self.mock_geocoder = mock.Mock()
+        self.mock_geocoder.reverse.side_effect = lambda point, exactly_one: geopy.location.Location("near %r" % (point,), geopy.location.Point(point[0], point[1], 0))
+
+        self.geocoder = BatchingGeocoder(self.mock_geocoder, precision=3, min_interval=0)
+
+    def test_reusesResultForNearbyPoints(self):
+        first = self.geocoder.reverse([42.347011, -71.096322], exactly_one=True)
+        second = self.geocoder.reverse([42.347100, -71.096400], exactly_one=True)
+
+        self.mock_geocoder.reverse.assert_called_once_with([42.347011, -71.096322], exactly_one=True)
+        eq_(first.address, second.address)
+
+    def test_distinctClustersAreLookedUpSeparately(self):
+        self.geocoder.reverse([42.347, -71.096], exactly_one=True)
+        self.geocoder.reverse([42.360, -71.058], exactly_one=True)
+
+        eq_(self.mock_geocoder.reverse.call_count, 2)
+
+    def test_concurrentRequestsShareOneCall(self):
+        release = threading.Event()
+        orig_side_effect = self.mock_geocoder.reverse.side_effect
+
+        def slow_reverse(point, exactly_one):
+            release.wait()
+            return orig_side_effect(point, exactly_one)
+
+        self.mock_geocoder.reverse.side_effect = slow_reverse
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.geocoder.reverse([42.347011, -71.096322], exactly_one=True)))
+            for _ in range(5)
+        ]
+
+        for t in threads:
+            t.start()
+
+        ## give the followers a chance to queue up behind the leader
+        time.sleep(0.1)
+        release.set()
+
+        for t in threads:
+            t.join()
+
+        eq_(self.mock_geocoder.reverse.call_count, 1)
+        eq_(len(results), 5)
+        eq_(len(set(r.address for r in results)), 1)
+
+    @raises(geopy.exc.GeocoderTimedOut)
+    def test_errorsAreNotCached(self):
+        self.mock_geocoder.reverse.side_effect = geopy.exc.GeocoderTimedOut("slow")
+
+        try:
+            self.geocoder.reverse([42.347, -71.096], exactly_one=True)
+        finally:
+            ok_(not self.geocoder._cache)
+
+    def test_throttlesProviderCalls(self):
+        self.geocoder.rate_limiter.min_interval = 0.2
+
+        start = time.time()
+        self.geocoder.reverse([42.347, -71.096], exactly_one=True)
+        self.geocoder.reverse([42.360, -71.058], exactly_one=True)
+
+        ok_(time.time() - start >= 0.2)
+
+    @raises(DeadlineExceededException)
+    def test_waitingForRateLimitCountsAgainstTimeout(self):
+        self.geocoder.rate_limiter.min_interval = 10
+        self.geocoder.reverse([42.347, -71.096], exactly_one=True)
+
+        try:
+            self.geocoder.reverse([42.360, -71.058], exactly_one=True, timeout=0.1)
+        finally:
+            eq_(self.mock_geocoder.reverse.call_count, 1)
+
+    def test_sharesResultsThroughCacheFile(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            cache_file = os.path.join(tmp_dir, "cache.json")
+
+            ## as if in separate worker processes
+            first = BatchingGeocoder(self.mock_geocoder, precision=3, min_interval=0, cache_file=cache_file)
+            second = BatchingGeocoder(self.mock_geocoder, precision=3, min_interval=0, cache_file=cache_file)
+
+            loc = first.reverse([42.347011, -71.096322], exactly_one=True)
+            shared = second.reverse([42.347100, -71.096400], exactly_one=True)
+
+            eq_(self.mock_geocoder.reverse.call_count, 1)
+            eq_(shared.address, loc.address)
+            eq_((shared.latitude, shared.longitude), (loc.latitude, loc.longitude))
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_ignoresUnreadableCacheFile(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            cache_file = os.path.join(tmp_dir, "cache.json")
+            with open(cache_file, "w") as ofp:
+                ofp.write("{not json")
+
+            geocoder = BatchingGeocoder(self.mock_geocoder, precision=3, min_interval=0, cache_file=cache_file)
+            geocoder.reverse([42.347, -71.096], exactly_one=True)
+
+            eq_(self.mock_geocoder.reverse.call_count, 1)
+            ok_(os.path.getsize(cache_file) > 0)
+        finally:
+            shutil.rmtree(tmp_dir)
@@ -0,0 +1,61 @@
+# -*- encoding: utf-8 -*-
+
+import deadline_s3
+from resilience import Deadline, DeadlineExceededException
+
+from nose.tools import eq_, ok_, raises
+import mock
+import StringIO
+import tinys3
+
+LIST_RESPONSE = """<?xml version="1.0" encoding="UTF-8"?>
+<ListBucketResult xmlns="http://s3.amazonaws.com/doc/2006-03-01/">
+  <IsTruncated>false</IsTruncated>
+  <Contents>
+    <Key>img/email/a/IMG_5810.JPG</Key>
+    <LastModified>2015-07-05T11:28:43.000Z</LastModified>
+    <ETag>"abc"</ETag>
+    <Size>1006317</Size>
+    <StorageClass>STANDARD</StorageClass>
+  </Contents>
+</ListBucketResult>
+"""
+
+
+class TestDeadlineS3:
+    def setup(self):
+        self.conn = tinys3.Connection("key", "secret", default_bucket="images", tls=True)
+
+    def test_listPassesTimeout(self):
+        with mock.patch("requests.get") as mock_get:
+            mock_get.return_value.content = LIST_RESPONSE
+
+            keys = list(deadline_s3.list_keys(self.conn, "img/email/a/", Deadline(30)))
+
+        eq_([k["key"] for k in keys], ["img/email/a/IMG_5810.JPG"])
+
+        eq_(mock_get.call_args[0][0], "https://s3.amazonaws.com/images/")
+        eq_(mock_get.call_args[1]["params"]["prefix"], "img/email/a/")
+        ok_(0 < mock_get.call_args[1]["timeout"] <= 30)
+
+    def test_uploadPassesTimeout(self):
+        with mock.patch("requests.put") as mock_put:
+            deadline_s3.upload(self.conn, "img/email/a/IMG_5810.JPG", StringIO.StringIO("jpeg"), Deadline(30), content_type="image/jpeg")
+
+        eq_(mock_put.call_args[0][0], "https://s3.amazonaws.com/images/img/email/a/IMG_5810.JPG")
+        eq_(mock_put.call_args[1]["headers"]["Content-Type"], "image/jpeg")
+        ok_(0 < mock_put.call_args[1]["timeout"] <= 30)
+
+    def test_unboundedDeadlineUsesNoTimeout(self):
+        with mock.patch("requests.put") as mock_put:
+            deadline_s3.upload(self.conn, "img/email/a/IMG_5810.JPG", StringIO.StringIO("jpeg"), Deadline())
+
+        eq_(mock_put.call_args[1]["timeout"], None)
+
+    @raises(DeadlineExceededException)
+    def test_expiredDeadlineMakesNoRequest(self):
+        with mock.patch("requests.get") as mock_get:
+            try:
+                list(deadline_s3.list_keys(self.conn, "img/email/a/", Deadline(0)))
+            finally:
+                ok_(not mock_get.called)
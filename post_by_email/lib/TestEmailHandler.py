@@ -1,8 +1,12 @@
 # -*- encoding: utf-8 -*-
 
-from EmailHandler import EmailHandler
+from EmailHandler import EmailHandler, PostExistsException, PostNotPublishedException
+from git import PushRejectedException
+from site_index import SiteIndex
+from resilience import Deadline, DeadlineExceededException, CircuitOpenException
+from accounting import RequestUsage
 
-from nose.tools import eq_, ok_
+from nose.tools import eq_, ok_, raises
 import mock
 import os
 import shutil
@@ -11,6 +15,8 @@ import gzip
 import rtyaml as yaml
 import StringIO
 import geopy
+import geopy.exc
+import time
 from email.mime.text import MIMEText
 from email.utils import formatdate
 
@@ -50,10 +56,24 @@ class TestEmailHandler:
         self.mock_git = mock.Mock()
         self.mock_git.repo_path = self.git_repo_dir
         self.mock_git.lock = mock.MagicMock()
+        self.mock_git.exists_upstream.side_effect = lambda path: self.mock_git.push_with_retry.called
+
+        ## the handler goes through lib.deadline_s3 so that requests carry the
+        ## deadline; pass them on to the connection mock (see TestDeadlineS3)
+        self.s3_patchers = [
+            mock.patch("lib.deadline_s3.list_keys", side_effect=lambda conn, prefix, deadline: conn.list(prefix)),
+            mock.patch("lib.deadline_s3.upload", side_effect=lambda conn, key, fp, deadline, **kwargs: conn.upload(key, fp, **kwargs)),
+        ]
+        
+        for patcher in self.s3_patchers:
+            patcher.start()
 
         self.handler = EmailHandler(self.mock_s3, "img/email", self.mock_geocoder, self.mock_git, commit_changes=True)
     
     def teardown(self):
+        for patcher in self.s3_patchers:
+            patcher.stop()
+        
         shutil.rmtree(self.git_repo_dir)
     
     def test_parseMessage(self):
@@ -75,10 +95,16 @@ class TestEmailHandler:
         eq_(self.mock_s3.upload.call_args[0][0], "img/email/2015-07-05-fenway-fireworks/IMG_5810.JPG")
         eq_(self.mock_s3.upload.call_args[1]["content_type"], "image/jpeg")
 
-        self.mock_git.clean_sweep.assert_called_once_with()
+        ## upload body is the decoded jpeg
+        photo_io = self.mock_s3.upload.call_args[0][1]
+        photo_io.seek(0)
+        eq_(photo_io.read(2), "\xff\xd8")
+        eq_(photo_io.len, 1006317)
+
+        self.mock_git.exists_upstream.assert_called_with("_posts/blog/2015-07-05-fenway-fireworks.md")
         self.mock_git.add_file.assert_called_once_with(post_fn)
         self.mock_git.commit.called_once_with("Brian Lalor", "blalor@bravo5.org", "Sun, 5 Jul 2015 07:28:43 -0400", "Fenway fireworks")
-        self.mock_git.push.called_once_with()
+        eq_(self.mock_git.push_with_retry.call_count, 1)
         
         ## bet those float comparisons will bite me later!
         self.mock_geocoder.reverse.assert_called_once_with([lat, lon], exactly_one=True)
@@ -247,3 +273,197 @@ some text ramble ramble bla bla bla
         img = frontmatter["images"][0]
         eq_(img["exif"]["dateTimeOriginal"], "2015-07-03T23:39:33")
         eq_(img["exif"]["dateTimeGps"],      "2015-07-04T03:39:33+00:00")
+
+    def test_updatesSiteIndex(self):
+        self.mock_s3.list.return_value = []
+        self.mock_geocoder.reverse.return_value = geopy.location.Location("the park", geopy.location.Point(42.347, -71.096, 0))
+        self.mock_s3.upload.return_value = None
+
+        site_index = SiteIndex(self.git_repo_dir)
+        self.handler.site_index = site_index
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            post_path = self.handler.process_stream(ifp)
+
+        post_fn = os.path.join(self.git_repo_dir, "_posts", "blog", post_path)
+
+        ## index changes go in the same commit as the post
+        self.mock_git.add_file.assert_called_once_with(post_fn, site_index.photos.path, site_index.tags.path)
+
+        photos = site_index.photos.read()
+        eq_(len(photos), 1)
+        eq_(photos[0]["path"], "img/email/2015-07-05-fenway-fireworks/IMG_5810.JPG")
+        eq_(photos[0]["post"], "_posts/blog/2015-07-05-fenway-fireworks.md")
+        eq_(photos[0]["name"], "the park")
+
+        eq_([t["tag"] for t in site_index.tags.read()], ["photo"])
+
+    def test_publishesWithoutLocationNameWhenGeocoderFails(self):
+        self.mock_s3.list.return_value = []
+        self.mock_geocoder.reverse.side_effect = geopy.exc.GeocoderTimedOut("too slow")
+        self.mock_s3.upload.return_value = None
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            post_path = self.handler.process_stream(ifp, Deadline(60))
+
+        ## geocoding gets no more than its share of the deadline
+        ok_(self.mock_geocoder.reverse.call_args[1]["timeout"] <= EmailHandler.GEOCODE_TIMEOUT)
+
+        frontmatter, body = parse_post(os.path.join(self.git_repo_dir, "_posts", "blog", post_path))
+        location = frontmatter["images"][0]["exif"]["location"]
+        eq_(location["latitude"], 42.347011111111115)
+        ok_("name" not in location)
+
+        ok_(self.mock_s3.upload.called)
+        ok_(self.mock_git.push_with_retry.called)
+
+    def test_skipsGeocoderWhileCircuitOpen(self):
+        self.mock_s3.list.return_value = []
+        self.mock_s3.upload.return_value = None
+
+        self.handler.breakers["geocoder"]._opened_at = time.time()
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            post_path = self.handler.process_stream(ifp)
+
+        ok_(not self.mock_geocoder.reverse.called)
+
+        frontmatter, body = parse_post(os.path.join(self.git_repo_dir, "_posts", "blog", post_path))
+        ok_("name" not in frontmatter["images"][0]["exif"]["location"])
+
+    @raises(DeadlineExceededException)
+    def test_failsFastWhenDeadlineExpired(self):
+        self.mock_s3.list.return_value = []
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            try:
+                self.handler.process_stream(ifp, Deadline(0))
+            finally:
+                ok_(not self.mock_s3.list.called)
+
+    def test_resendAfterFailedPush(self):
+        self.mock_s3.list.return_value = []
+        self.mock_geocoder.reverse.return_value = None
+
+        def failed_push(deadline):
+            ## Git.push_with_retry resets to origin/master when it gives up
+            shutil.rmtree(os.path.join(self.git_repo_dir, "_posts"))
+            raise PushRejectedException("rejected")
+
+        self.mock_git.push_with_retry.side_effect = failed_push
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            try:
+                self.handler.process_stream(ifp)
+                ok_(False, "push should have failed")
+            except PushRejectedException:
+                pass
+
+        ## the image made it to S3 the first time
+        self.mock_s3.list.return_value = ["img/email/2015-07-05-fenway-fireworks/IMG_5810.JPG"]
+        self.mock_git.push_with_retry.reset_mock()
+        self.mock_git.push_with_retry.side_effect = None
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            eq_(self.handler.process_stream(ifp), "2015-07-05-fenway-fireworks.md")
+
+        eq_(self.mock_s3.upload.call_count, 2)
+        eq_(self.mock_git.commit.call_count, 2)
+
+    def test_discardsChangesWhenCommitFails(self):
+        site_index = SiteIndex(self.git_repo_dir)
+        self.handler.site_index = site_index
+
+        self.mock_s3.list.return_value = []
+        self.mock_geocoder.reverse.return_value = None
+        self.mock_git.commit.side_effect = OSError("disk full")
+
+        def discard_changes():
+            ## what git reset --hard; git clean does to the new files
+            shutil.rmtree(os.path.join(self.git_repo_dir, "_posts"))
+            shutil.rmtree(os.path.join(self.git_repo_dir, "_data"))
+
+        self.mock_git.discard_changes.side_effect = discard_changes
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            try:
+                self.handler.process_stream(ifp)
+                ok_(False, "commit should have failed")
+            except OSError:
+                pass
+
+        eq_(self.mock_git.discard_changes.call_count, 1)
+        ok_(not self.mock_git.push_with_retry.called)
+
+        ## resending works
+        self.mock_git.commit.side_effect = None
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            eq_(self.handler.process_stream(ifp), "2015-07-05-fenway-fireworks.md")
+
+        eq_(len(site_index.photos.read()), 1)
+
+    @raises(CircuitOpenException)
+    def test_failsFastWhileGitCircuitOpen(self):
+        self.handler.breakers["git"]._opened_at = time.time()
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            try:
+                self.handler.process_stream(ifp)
+            finally:
+                ok_(not self.mock_s3.upload.called)
+                ok_(not self.mock_git.commit.called)
+
+    @raises(CircuitOpenException)
+    def test_writesNothingIfGitCircuitOpensDuringUpload(self):
+        self.mock_s3.list.return_value = []
+        self.mock_geocoder.reverse.return_value = None
+
+        def upload(*args, **kwargs):
+            self.handler.breakers["git"]._opened_at = time.time()
+
+        self.mock_s3.upload.side_effect = upload
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            try:
+                self.handler.process_stream(ifp)
+            finally:
+                ok_(not os.path.exists(os.path.join(self.git_repo_dir, "_posts")))
+                ok_(not self.mock_git.commit.called)
+
+    def test_recordsDecodedBytes(self):
+        self.mock_s3.list.return_value = []
+        self.mock_geocoder.reverse.return_value = None
+        self.mock_s3.upload.return_value = None
+
+        usage = RequestUsage(0)
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            self.handler.process_stream(ifp, usage=usage)
+
+        eq_(usage.decoded_bytes, 1006317)
+
+    @raises(PostExistsException)
+    def test_rejectsPostAlreadyPublished(self):
+        self.mock_git.exists_upstream.side_effect = None
+        self.mock_git.exists_upstream.return_value = True
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            try:
+                self.handler.process_stream(ifp)
+            finally:
+                ok_(self.mock_git.fetch.called)
+                ok_(not self.mock_s3.upload.called)
+
+    @raises(PostNotPublishedException)
+    def test_failsWhenPostDroppedBeforePush(self):
+        self.mock_s3.list.return_value = []
+        self.mock_geocoder.reverse.return_value = None
+        self.mock_s3.upload.return_value = None
+
+        ## another worker reset the branch; our push had nothing to send
+        self.mock_git.exists_upstream.side_effect = None
+        self.mock_git.exists_upstream.return_value = False
+
+        with gzip.open(os.path.join(self.FIXTURE_DIR, "photo-1.msg.gz"), "r") as ifp:
+            self.handler.process_stream(ifp)
@@ -0,0 +1,177 @@
+# -*- encoding: utf-8 -*-
+
+from git import Git, PushRejectedException, run
+from resilience import Deadline, DeadlineExceededException
+
+from nose.tools import eq_, ok_, raises
+import mock
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from email.utils import formatdate
+
+
+def git_cmd(cwd, *args):
+    return subprocess.check_output(("git",) + args, cwd=cwd)
+
+
+class TestGit:
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+        ## bare "origin" with a single commit on master
+        self.origin = os.path.join(self.tmp_dir, "origin.git")
+        git_cmd(self.tmp_dir, "init", "--quiet", "--bare", self.origin)
+        git_cmd(self.origin, "symbolic-ref", "HEAD", "refs/heads/master")
+
+        seed = os.path.join(self.tmp_dir, "seed")
+        git_cmd(self.tmp_dir, "clone", "--quiet", self.origin, seed)
+        git_cmd(seed, "-c", "user.name=seed", "-c", "user.email=seed@localhost", "commit", "--quiet", "--allow-empty", "-m", "initial")
+        git_cmd(seed, "push", "--quiet", "origin", "HEAD:master")
+
+        self.git_a = self.__clone("a")
+        self.git_b = self.__clone("b")
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def __clone(self, name):
+        git = Git("file://" + self.origin, os.path.join(self.tmp_dir, name), push_backoff=0)
+        git.clone()
+
+        ## Git.commit replaces the environment, so the committer has to come from the repo
+        git_cmd(git.repo_path, "config", "user.name", name)
+        git_cmd(git.repo_path, "config", "user.email", name + "@localhost")
+
+        return git
+
+    def __commit_file(self, git, name, content=None):
+        fn = os.path.join(git.repo_path, name)
+        with open(fn, "w") as ofp:
+            ofp.write(name if content is None else content)
+
+        with git.lock():
+            git.add_file(fn)
+            git.commit("Some One", "someone@localhost", formatdate(1436782211), u"add " + name)
+
+    def __origin_log(self):
+        return git_cmd(self.origin, "log", "--format=%s", "master").splitlines()
+
+    def test_pushFastForward(self):
+        self.__commit_file(self.git_a, "a.md")
+        self.git_a.push_with_retry()
+
+        eq_(self.__origin_log(), ["add a.md", "initial"])
+
+    @raises(PushRejectedException)
+    def test_pushRejectedWhenBehind(self):
+        self.__commit_file(self.git_a, "a.md")
+        self.git_a.push()
+
+        self.__commit_file(self.git_b, "b.md")
+        self.git_b.push()
+
+    def test_pushRebasesAndRetries(self):
+        self.__commit_file(self.git_a, "a.md")
+        self.git_a.push_with_retry()
+
+        ## b never fetched a's commit
+        self.__commit_file(self.git_b, "b.md")
+        self.git_b.push_with_retry()
+
+        eq_(self.__origin_log(), ["add b.md", "add a.md", "initial"])
+        ok_(os.path.exists(os.path.join(self.git_b.repo_path, "a.md")))
+
+    @raises(PushRejectedException)
+    def test_pushGivesUpAfterRetries(self):
+        self.git_b.push_retries = 2
+        self.__commit_file(self.git_b, "b.md")
+
+        with mock.patch.object(self.git_b, "push", side_effect=PushRejectedException("nope")):
+            try:
+                self.git_b.push_with_retry()
+            finally:
+                eq_(self.git_b.push.call_count, 3)
+
+    def test_failedRebaseResetsToOrigin(self):
+        self.__commit_file(self.git_a, "a.md", "from a")
+        self.git_a.push_with_retry()
+
+        ## same file, different content; can't be rebased
+        self.__commit_file(self.git_b, "a.md", "from b")
+
+        try:
+            self.git_b.push_with_retry()
+            ok_(False, "push should have failed")
+        except subprocess.CalledProcessError:
+            pass
+
+        ## b's commit was dropped, so the next post isn't stuck behind it
+        eq_(git_cmd(self.git_b.repo_path, "rev-parse", "HEAD"), git_cmd(self.origin, "rev-parse", "master"))
+        with open(os.path.join(self.git_b.repo_path, "a.md"), "r") as ifp:
+            eq_(ifp.read(), "from a")
+
+        self.__commit_file(self.git_b, "b.md")
+        self.git_b.push_with_retry()
+        eq_(self.__origin_log(), ["add b.md", "add a.md", "initial"])
+
+    def test_discardChanges(self):
+        self.__commit_file(self.git_a, "a.md")
+
+        with open(os.path.join(self.git_a.repo_path, "a.md"), "w") as ofp:
+            ofp.write("changed")
+
+        os.makedirs(os.path.join(self.git_a.repo_path, "_posts"))
+        with open(os.path.join(self.git_a.repo_path, "_posts", "new.md"), "w") as ofp:
+            ofp.write("new")
+
+        self.git_a.add_file(os.path.join(self.git_a.repo_path, "_posts", "new.md"))
+
+        with self.git_a.lock():
+            self.git_a.discard_changes()
+
+        ## the unpushed commit is kept
+        eq_(git_cmd(self.git_a.repo_path, "status", "--porcelain"), "")
+        with open(os.path.join(self.git_a.repo_path, "a.md"), "r") as ifp:
+            eq_(ifp.read(), "a.md")
+
+        ok_(not os.path.exists(os.path.join(self.git_a.repo_path, "_posts")))
+
+        self.git_a.push_with_retry()
+        eq_(self.__origin_log(), ["add a.md", "initial"])
+
+    def test_existsUpstream(self):
+        self.__commit_file(self.git_a, "a.md")
+        ok_(not self.git_a.exists_upstream("a.md"))
+
+        self.git_a.push_with_retry()
+        ok_(self.git_a.exists_upstream("a.md"))
+
+        ok_(not self.git_b.exists_upstream("a.md"))
+        self.git_b.fetch()
+        ok_(self.git_b.exists_upstream("a.md"))
+
+    @raises(DeadlineExceededException)
+    def test_runKillsSlowCommands(self):
+        start = time.time()
+        try:
+            run(["sleep", "10"], self.tmp_dir, timeout=0.2)
+        finally:
+            ok_(time.time() - start < 5)
+
+    @raises(DeadlineExceededException)
+    def test_runKillsChildProcesses(self):
+        start = time.time()
+        try:
+            ## the grandchild keeps the output pipe open unless it's killed, too
+            run(["sh", "-c", "sleep 4; echo done"], self.tmp_dir, timeout=0.2)
+        finally:
+            ok_(time.time() - start < 2)
+
+    @raises(DeadlineExceededException)
+    def test_pushWithRetryStopsAtDeadline(self):
+        self.__commit_file(self.git_b, "b.md")
+
+        self.git_b.push_with_retry(Deadline(0))
@@ -0,0 +1,50 @@
+# -*- encoding: utf-8 -*-
+
+from post import read_post, write_post, PostFormatException
+
+from nose.tools import eq_, raises
+import StringIO
+import codecs
+from collections import OrderedDict
+
+
+def utf8_io(data=""):
+    return codecs.getreader("utf-8")(StringIO.StringIO(data)), codecs.getwriter("utf-8")(StringIO.StringIO())
+
+
+class TestPost:
+    def test_roundTrip(self):
+        fm = OrderedDict()
+        fm["date"] = "2015-07-05T07:28:43-04:00"
+        fm["title"] = u"Fenway \"fireworks\" 🔫"
+        fm["layout"] = "post"
+        fm["tags"] = ["photo"]
+        fm["images"] = [OrderedDict([("path", "img/email/x/IMG_5810.JPG"), ("exif", {"location": {"latitude": 42.347011111111115, "name": u"the park"}})])]
+
+        _, writer = utf8_io()
+        write_post(writer, fm, u"some text\nmore text 👍")
+        written = writer.stream.getvalue()
+
+        reader, _ = utf8_io(written)
+        frontmatter, body = read_post(reader)
+
+        eq_(frontmatter.keys()[0], "title")
+        eq_(frontmatter["title"], fm["title"])
+        eq_(frontmatter["images"][0]["exif"]["location"]["latitude"], 42.347011111111115)
+        eq_(dict(frontmatter), dict(fm))
+        eq_(body, u"some text\nmore text 👍")
+
+        ## rewriting what was read doesn't change anything
+        _, writer = utf8_io()
+        write_post(writer, frontmatter, body)
+        eq_(writer.stream.getvalue(), written)
+
+    @raises(PostFormatException)
+    def test_missingFrontmatter(self):
+        reader, _ = utf8_io("just text\n")
+        read_post(reader)
+
+    @raises(PostFormatException)
+    def test_unterminatedFrontmatter(self):
+        reader, _ = utf8_io("---\ntitle: \"foo\"\n")
+        read_post(reader)
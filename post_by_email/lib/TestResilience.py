@@ -0,0 +1,154 @@
+# -*- encoding: utf-8 -*-
+
+from resilience import Deadline, DeadlineReader, DeadlineExceededException, CircuitBreaker, CircuitOpenException, RateLimiter
+
+from nose.tools import eq_, ok_, raises
+import fcntl
+import mock
+import os
+import shutil
+import StringIO
+import tempfile
+import time
+
+
+class TestDeadline:
+    def test_unbounded(self):
+        deadline = Deadline()
+
+        eq_(deadline.remaining(), None)
+        eq_(deadline.timeout(), None)
+        eq_(deadline.timeout(5), 5)
+
+    def test_bounded(self):
+        deadline = Deadline(10)
+
+        ok_(9 < deadline.remaining() <= 10)
+        eq_(deadline.timeout(5), 5)
+        ok_(9 < deadline.timeout(60) <= 10)
+
+    @raises(DeadlineExceededException)
+    def test_expired(self):
+        Deadline(0).timeout(5)
+
+    @raises(DeadlineExceededException)
+    def test_readerFailsAfterDeadline(self):
+        fp = StringIO.StringIO("some data")
+        reader = DeadlineReader(fp, Deadline(60))
+
+        eq_(reader.read(4), "some")
+
+        reader.deadline = Deadline(0)
+        reader.read(4)
+
+
+class TestCircuitBreaker:
+    def setup(self):
+        self.breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+
+    def __fail(self):
+        try:
+            with self.breaker:
+                raise IOError("boom")
+        except IOError:
+            pass
+
+    def test_opensAfterConsecutiveFailures(self):
+        self.__fail()
+        ok_(not self.breaker.is_open)
+
+        self.__fail()
+        ok_(self.breaker.is_open)
+
+    def test_successResetsFailures(self):
+        self.__fail()
+
+        with self.breaker:
+            pass
+
+        self.__fail()
+        ok_(not self.breaker.is_open)
+
+    @raises(CircuitOpenException)
+    def test_rejectsWhileOpen(self):
+        self.__fail()
+        self.__fail()
+
+        with self.breaker:
+            pass
+
+    def test_halfOpenAfterResetTimeout(self):
+        self.__fail()
+        self.__fail()
+
+        with mock.patch("time.time", return_value=self.breaker._opened_at + 61):
+            ## trial call goes through and closes the circuit
+            with self.breaker:
+                pass
+
+        ok_(not self.breaker.is_open)
+
+    def test_failedTrialReopens(self):
+        self.__fail()
+        self.__fail()
+
+        with mock.patch("time.time", return_value=self.breaker._opened_at + 61):
+            self.__fail()
+
+            ok_(self.breaker.is_open)
+
+
+class TestRateLimiter:
+    def setup(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def teardown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_spacesCalls(self):
+        limiter = RateLimiter(0.2)
+
+        start = time.time()
+        limiter.wait()
+        limiter.wait()
+
+        ok_(time.time() - start >= 0.2)
+
+    def test_sharesIntervalThroughStateFile(self):
+        state_file = os.path.join(self.tmp_dir, "rate")
+
+        ## as if in separate processes
+        first = RateLimiter(0.2, state_file)
+        second = RateLimiter(0.2, state_file)
+
+        start = time.time()
+        first.wait()
+        second.wait()
+
+        ok_(time.time() - start >= 0.2)
+
+    @raises(DeadlineExceededException)
+    def test_timesOutInsteadOfSleeping(self):
+        limiter = RateLimiter(10)
+        limiter.wait()
+
+        start = time.time()
+        try:
+            limiter.wait(timeout=0.1)
+        finally:
+            ok_(time.time() - start < 1)
+
+    @raises(DeadlineExceededException)
+    def test_timesOutWaitingForStateFileLock(self):
+        state_file = os.path.join(self.tmp_dir, "rate")
+        limiter = RateLimiter(0, state_file)
+
+        ## another process is holding it
+        with open(state_file, "a+") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+
+            start = time.time()
+            try:
+                limiter.wait(timeout=0.2)
+            finally:
+                ok_(time.time() - start < 1)
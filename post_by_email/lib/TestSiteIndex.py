@@ -0,0 +1,122 @@
+# -*- encoding: utf-8 -*-
+
+from site_index import SiteIndex, DataIndex
+
+from nose.tools import eq_, ok_
+import mock
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+
+
+class TestSiteIndex:
+    def setup(self):
+        self.repo_dir = tempfile.mkdtemp()
+        self.index = SiteIndex(self.repo_dir, compact_threshold=3)
+
+    def teardown(self):
+        shutil.rmtree(self.repo_dir)
+
+    def __frontmatter(self, slug, name=u"Bleachers, Boston"):
+        fm = OrderedDict()
+        fm["date"] = "2015-07-05T07:28:43-04:00"
+        fm["tags"] = ["photo", u"fenway 🔥"]
+        fm["images"] = [
+            OrderedDict([
+                ("path", "img/email/%s/IMG_5810.JPG" % slug),
+                ("exif", OrderedDict([
+                    ("dateTimeOriginal", "2015-07-03T23:39:33"),
+                    ("location", OrderedDict([
+                        ("latitude", 42.347011111111115),
+                        ("longitude", -71.09632222222221),
+                        ("name", name),
+                    ])),
+                ])),
+            ]),
+        ]
+
+        return fm
+
+    def test_addPost(self):
+        changed = self.index.add_post("_posts/blog/2015-07-05-fenway.md", self.__frontmatter("2015-07-05-fenway"))
+
+        eq_(changed, [os.path.join(self.repo_dir, "_data", "photos.csv"), os.path.join(self.repo_dir, "_data", "tags.csv")])
+
+        photos = self.index.photos.read()
+        eq_(len(photos), 1)
+        eq_(photos[0]["path"], "img/email/2015-07-05-fenway/IMG_5810.JPG")
+        eq_(photos[0]["post"], "_posts/blog/2015-07-05-fenway.md")
+        eq_(float(photos[0]["latitude"]), 42.347011111111115)
+        eq_(float(photos[0]["longitude"]), -71.09632222222221)
+        eq_(photos[0]["name"], u"Bleachers, Boston")
+
+        eq_([(t["tag"], t["post"]) for t in self.index.tags.read()], [
+            (u"photo", u"_posts/blog/2015-07-05-fenway.md"),
+            (u"fenway 🔥", u"_posts/blog/2015-07-05-fenway.md"),
+        ])
+
+        with open(self.index.photos.path, "r") as ifp:
+            eq_(ifp.readline(), "path,post,date,dateTimeOriginal,latitude,longitude,name\n")
+
+    def test_addPostWithoutImagesOrTags(self):
+        fm = OrderedDict([("date", "2015-07-05T07:28:43-04:00"), ("tags", [])])
+
+        eq_(self.index.add_post("_posts/blog/2015-07-05-text.md", fm), [])
+        ok_(not os.path.exists(self.index.photos.path))
+
+    def test_appendsWithoutRewriting(self):
+        self.index.add_post("_posts/blog/a.md", self.__frontmatter("a"))
+
+        with open(self.index.photos.path, "r") as ifp:
+            before = ifp.read()
+
+        self.index.add_post("_posts/blog/b.md", self.__frontmatter("b"))
+
+        with open(self.index.photos.path, "r") as ifp:
+            ok_(ifp.read().startswith(before))
+
+    def test_compactsSupersededRows(self):
+        for i in range(3):
+            self.index.add_post("_posts/blog/a.md", self.__frontmatter("a", name=u"name %d" % i))
+
+        ## two superseded rows; below the threshold
+        eq_(len(self.index.photos.read()), 3)
+
+        self.index.add_post("_posts/blog/a.md", self.__frontmatter("a", name=u"latest"))
+
+        photos = self.index.photos.read()
+        eq_(len(photos), 1)
+        eq_(photos[0]["name"], u"latest")
+
+    def test_appendDoesNotRereadFile(self):
+        self.index.add_post("_posts/blog/a.md", self.__frontmatter("a"))
+
+        with mock.patch.object(self.index.photos, "read") as mock_read:
+            self.index.add_post("_posts/blog/b.md", self.__frontmatter("b"))
+            self.index.add_post("_posts/blog/a.md", self.__frontmatter("a", name=u"again"))
+
+        ok_(not mock_read.called)
+
+    def test_countsRowsAddedElsewhere(self):
+        path = os.path.join(self.repo_dir, "_data", "x.csv")
+        index_a = DataIndex(path, ["k", "v"], ["k"], compact_threshold=2)
+        index_b = DataIndex(path, ["k", "v"], ["k"], compact_threshold=2)
+
+        index_a.append([{"k": "1", "v": "a"}])
+        index_b.append([{"k": "1", "v": "b"}])
+
+        ## a has to notice b's row to know that two have now been superseded
+        index_a.append([{"k": "1", "v": "c"}])
+
+        eq_([(r["k"], r["v"]) for r in index_a.read()], [(u"1", u"c")])
+
+    def test_ignoresDuplicateHeaders(self):
+        index = DataIndex(os.path.join(self.repo_dir, "_data", "x.csv"), ["k", "v"], ["k"])
+
+        ## as left by a union merge of two branches that both created the file
+        os.makedirs(os.path.dirname(index.path))
+        with open(index.path, "w") as ofp:
+            ofp.write("k,v\n1,a\nk,v\n2,b\n")
+
+        eq_([(r["k"], r["v"]) for r in index.read()], [(u"1", u"a"), (u"2", u"b")])
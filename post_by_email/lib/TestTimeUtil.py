@@ -0,0 +1,75 @@
+# -*- encoding: utf-8 -*-
+
+from time_util import parse_date, _parse_date_email_utils, parse_exif_datetime, fixed_offset
+
+from nose.tools import eq_, ok_, raises
+import os
+import glob
+import gzip
+import email
+import datetime
+import exifread
+import StringIO
+from email.utils import formatdate
+
+
+def fixture_messages():
+    for fn in sorted(glob.glob(os.path.abspath(os.path.join(__file__, "../../test-fixtures/*.msg.gz")))):
+        with gzip.open(fn, "r") as ifp:
+            yield email.message_from_file(ifp)
+
+
+class TestTimeUtil:
+    def __assert_equivalent(self, date_str):
+        fast = parse_date(date_str)
+        slow = _parse_date_email_utils(date_str)
+
+        eq_(fast, slow, date_str)
+        eq_(fast.isoformat(), slow.isoformat(), date_str)
+        eq_(fast.utcoffset(), slow.utcoffset(), date_str)
+
+    def test_parseDateMatchesEmailUtilsForFixtures(self):
+        for msg in fixture_messages():
+            self.__assert_equivalent(msg["Date"])
+
+            ## Received headers end with "; <date>"
+            for received in msg.get_all("Received"):
+                self.__assert_equivalent(received.rsplit(";", 1)[1])
+
+    def test_parseDateMatchesEmailUtils(self):
+        for date_str in [
+            "Sun, 5 Jul 2015 07:28:43 -0400",
+            "Mon, 13 Jul 2015 10:10:11 +0530",
+            "5 Jul 2015 07:28 -0400",
+            formatdate(1436782211),
+            formatdate(1436782211, localtime=True),
+
+            ## fall back to email.utils
+            "Sun, 5 Jul 2015 07:28:43 EST",
+            "Sun, 31 Feb 2015 07:28:43 -0400",
+        ]:
+            self.__assert_equivalent(date_str)
+
+    def test_fixedOffsetIsCached(self):
+        ok_(fixed_offset(-14400) is fixed_offset(-14400))
+        eq_(fixed_offset(-14400).utcoffset(), datetime.timedelta(hours=-4))
+        ok_(parse_date("Sun, 5 Jul 2015 07:28:43 -0400").tzinfo is parse_date("Sun, 5 Jul 2015 09:28:43 -0400").tzinfo)
+
+    def test_parseExifDatetimeMatchesStrptimeForFixtures(self):
+        for msg in fixture_messages():
+            for part in msg.walk():
+                if part.get_content_type() != "image/jpeg":
+                    continue
+
+                tags = exifread.process_file(StringIO.StringIO(part.get_payload(decode=True)), details=False)
+                for tag in ("EXIF DateTimeOriginal", "EXIF DateTimeDigitized", "Image DateTime"):
+                    if tag in tags:
+                        value = tags[tag].printable
+                        eq_(parse_exif_datetime(value), datetime.datetime.strptime(value, "%Y:%m:%d %H:%M:%S"))
+
+    def test_parseExifDatetime(self):
+        eq_(parse_exif_datetime("2015:07:03 23:39:33"), datetime.datetime(2015, 7, 3, 23, 39, 33))
+
+    @raises(ValueError)
+    def test_parseExifDatetimeInvalid(self):
+        parse_exif_datetime("2015-07-03T23:39:33")
@@ -0,0 +1,191 @@
+# -*- encoding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import resource
+import threading
+import time
+from collections import deque, OrderedDict
+from contextlib import contextmanager
+
+
+class OverBudgetException(Exception):
+    """request can't be admitted without exceeding the worker's memory budget"""
+    pass
+
+
+def current_rss():
+    """resident set size of this process in bytes"""
+    try:
+        with open("/proc/self/statm", "r") as ifp:
+            return int(ifp.read().split()[1]) * resource.getpagesize()
+    except (IOError, IndexError, ValueError):
+        ## no /proc; the high-water mark is the best we can do (KB on Linux)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def peak_rss():
+    """high-water mark of this process's resident set size in bytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class RequestUsage(object):
+    """
+    Resources used by a single request.  CPU time and RSS are measured for the
+    whole process, so with several threads per worker they include whatever
+    else was running at the same time.
+    """
+    def __init__(self, estimated_bytes):
+        super(RequestUsage, self).__init__()
+
+        self.estimated_bytes = estimated_bytes
+
+        ## attachment bytes decoded while handling the request; updated by EmailHandler
+        self.decoded_bytes = 0
+
+        self.queued_time = 0
+        self.wall_time = None
+        self.cpu_time = None
+        self.rss_delta = None
+        self.peak_rss_delta = None
+
+        self._start = None
+
+    def start(self):
+        self._start = (time.time(), cpu_time(), current_rss(), peak_rss())
+
+    def finish(self):
+        start_wall, start_cpu, start_rss, start_peak = self._start
+
+        self.wall_time = time.time() - start_wall
+        self.cpu_time = cpu_time() - start_cpu
+        self.rss_delta = current_rss() - start_rss
+        self.peak_rss_delta = peak_rss() - start_peak
+
+    def as_dict(self):
+        return OrderedDict([
+            ("estimated_bytes", self.estimated_bytes),
+            ("decoded_bytes", self.decoded_bytes),
+            ("queued_time", self.queued_time),
+            ("wall_time", self.wall_time),
+            ("cpu_time", self.cpu_time),
+            ("rss_delta", self.rss_delta),
+            ("peak_rss_delta", self.peak_rss_delta),
+        ])
+
+
+class ResourceAccountant(object):
+    """
+    Admission control and accounting for one worker process.  Each request
+    reserves its estimated memory; requests that would push the reservations
+    past `memory_budget` wait up to `queue_timeout` seconds for others to
+    finish, and are rejected if they can't fit at all.
+    """
+    def __init__(self, memory_budget, queue_timeout=30, history=100):
+        super(ResourceAccountant, self).__init__()
+
+        self.memory_budget = memory_budget
+        self.queue_timeout = queue_timeout
+
+        self._cond = threading.Condition()
+        self._reserved = 0
+        self._active = 0
+        self._queued = 0
+
+        self._admitted = 0
+        self._rejected = 0
+        self._totals = OrderedDict([("decoded_bytes", 0), ("wall_time", 0), ("cpu_time", 0)])
+        self._max = OrderedDict([("estimated_bytes", 0), ("decoded_bytes", 0), ("rss_delta", 0), ("peak_rss_delta", 0)])
+        self._recent = deque(maxlen=history)
+
+    def __reserve(self, estimated_bytes, timeout):
+        if estimated_bytes > self.memory_budget:
+            raise OverBudgetException("%d bytes exceeds budget of %d" % (estimated_bytes, self.memory_budget))
+
+        end = time.time() + timeout
+
+        with self._cond:
+            self._queued += 1
+            try:
+                while self._reserved + estimated_bytes > self.memory_budget:
+                    remaining = end - time.time()
+                    if remaining <= 0:
+                        raise OverBudgetException("timed out waiting for %d bytes; %d of %d reserved" % (estimated_bytes, self._reserved, self.memory_budget))
+
+                    self._cond.wait(remaining)
+            finally:
+                self._queued -= 1
+
+            self._reserved += estimated_bytes
+            self._active += 1
+            self._admitted += 1
+
+    def __release(self, usage):
+        with self._cond:
+            self._reserved -= usage.estimated_bytes
+            self._active -= 1
+
+            for k in self._totals:
+                self._totals[k] += getattr(usage, k)
+
+            for k in self._max:
+                self._max[k] = max(self._max[k], getattr(usage, k))
+
+            self._recent.append(usage.as_dict())
+
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, estimated_bytes, deadline=None):
+        """
+        Reserves memory for a request and yields its RequestUsage, waiting for
+        room if necessary.  Raises OverBudgetException if it can't be admitted.
+        """
+        timeout = self.queue_timeout if deadline is None else deadline.timeout(self.queue_timeout, what="admission")
+
+        usage = RequestUsage(estimated_bytes)
+
+        queued_at = time.time()
+        try:
+            self.__reserve(estimated_bytes, timeout)
+        except OverBudgetException:
+            with self._cond:
+                self._rejected += 1
+
+            logger.warn("rejecting request needing %d bytes", estimated_bytes)
+            raise
+
+        usage.queued_time = time.time() - queued_at
+
+        usage.start()
+        try:
+            yield usage
+        finally:
+            usage.finish()
+            self.__release(usage)
+
+            logger.info("request usage: %s", ", ".join("%s=%s" % i for i in usage.as_dict().items()))
+
+    def stats(self):
+        with self._cond:
+            return OrderedDict([
+                ("pid", os.getpid()),
+                ("memory_budget", self.memory_budget),
+                ("reserved", self._reserved),
+                ("active", self._active),
+                ("queued", self._queued),
+                ("admitted", self._admitted),
+                ("rejected", self._rejected),
+                ("rss", current_rss()),
+                ("peak_rss", peak_rss()),
+                ("totals", OrderedDict(self._totals)),
+                ("max", OrderedDict(self._max)),
+                ("recent", list(self._recent)),
+            ])
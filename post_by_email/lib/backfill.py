@@ -0,0 +1,273 @@
+# -*- encoding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import glob
+import json
+import codecs
+import copy
+import StringIO
+import time
+from email.utils import formatdate
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import geopy.exc
+import requests
+from tinys3.request_factory import S3Request
+
+import lib.exif_renderer as exif_renderer
+from lib.post import read_post, write_post
+from lib.resilience import CircuitBreaker, CircuitOpenException, DeadlineExceededException, RateLimiter
+
+
+class Backfill(object):
+    """
+    Reprocesses existing posts: fills in location names that couldn't be
+    looked up at ingest and, optionally, re-renders EXIF from the images in S3.
+    Updates are committed in batches; progress is checkpointed after each
+    batch so an interrupted run picks up where it left off.
+    """
+
+    ## EXIF lives in the APP1 segment, which is at most 64KB
+    EXIF_HEADER_BYTES = 128 * 1024
+
+    ## seconds to wait for S3 to respond
+    S3_TIMEOUT = 30
+
+    def __init__(
+        self, s3, geocoder, git,
+        commit_changes=False, site_index=None, refresh_exif=False,
+        workers=4, batch_size=20, s3_interval=0.1, pause=0,
+        author_name="post by email", author_email="post-by-email@localhost",
+        checkpoint_path=None,
+    ):
+        super(Backfill, self).__init__()
+
+        self.s3 = s3
+        self.geocoder = geocoder
+        self.git = git
+        self.commit_changes = commit_changes
+
+        ## optional lib.site_index.SiteIndex; photo rows are superseded on update
+        self.site_index = site_index
+        self.refresh_exif = refresh_exif
+
+        self.workers = workers
+        self.batch_size = batch_size
+        self.s3_rate_limiter = RateLimiter(s3_interval)
+
+        ## seconds to wait between batches, to leave room for live ingestion
+        self.pause = pause
+
+        self.author_name = author_name
+        self.author_email = author_email
+
+        if checkpoint_path is None:
+            checkpoint_path = os.path.join(git.repo_path, ".git", "backfill-checkpoint.json")
+
+        self.checkpoint_path = checkpoint_path
+
+        self.posts_dir = os.path.join(git.repo_path, "_posts", "blog")
+
+        self.breakers = {
+            "s3": CircuitBreaker("s3"),
+            "geocoder": CircuitBreaker("geocoder"),
+        }
+
+    def read_checkpoint(self):
+        """name of the last post in the last committed batch, or None"""
+        if not os.path.exists(self.checkpoint_path):
+            return None
+
+        with open(self.checkpoint_path, "r") as ifp:
+            return json.load(ifp).get("last_post")
+
+    def write_checkpoint(self, last_post):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as ofp:
+            json.dump({"last_post": last_post}, ofp)
+
+        os.rename(tmp_path, self.checkpoint_path)
+
+    def clear_checkpoint(self):
+        if os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+    def pending_posts(self):
+        """post filenames not yet covered by the checkpoint, oldest first"""
+        last_post = self.read_checkpoint()
+
+        return [
+            fn for fn in sorted(os.path.basename(p) for p in glob.glob(os.path.join(self.posts_dir, "*.md")))
+            if last_post is None or fn > last_post
+        ]
+
+    def __fetch_exif(self, path):
+        """renders EXIF from just the start of the image in S3"""
+        ## tinys3's get() can't make a ranged request, so make it with the
+        ## connection's credentials and url
+        url = S3Request(self.s3).bucket_url(path, self.s3.bucket(None))
+
+        self.s3_rate_limiter.wait()
+
+        with self.breakers["s3"]:
+            resp = requests.get(
+                url,
+                auth=self.s3.auth,
+                headers={"Range": "bytes=0-%d" % (self.EXIF_HEADER_BYTES - 1)},
+                timeout=self.S3_TIMEOUT,
+            )
+            resp.raise_for_status()
+
+        return exif_renderer.render_stream(StringIO.StringIO(resp.content))
+
+    def __geocode(self, location):
+        point = [location["latitude"], location["longitude"]]
+
+        try:
+            with self.breakers["geocoder"]:
+                loc = self.geocoder.reverse(point, exactly_one=True)
+        except (geopy.exc.GeopyError, DeadlineExceededException, CircuitOpenException), e:
+            logger.warn("reverse geocoding unavailable for %r: %r", tuple(point), e)
+            return None
+
+        if not loc:
+            logger.warn("no reverse geocoding result found for %r", tuple(point))
+            return None
+
+        return loc.address
+
+    def process_image(self, img_info):
+        """updates img_info in place; returns True if anything changed"""
+        old_exif = img_info.get("exif") or {}
+
+        if self.refresh_exif:
+            exif = self.__fetch_exif(img_info["path"])
+
+            ## keep the name we already have; it's expensive to look up again
+            if "location" in exif and old_exif.get("location", {}).get("name"):
+                exif["location"]["name"] = old_exif["location"]["name"]
+        else:
+            exif = copy.deepcopy(old_exif)
+
+        location = exif.get("location")
+        if location and not location.get("name"):
+            name = self.__geocode(location)
+            if name:
+                location["name"] = name
+
+        img_info["exif"] = exif
+
+        return exif != old_exif
+
+    def process_post(self, post_fn):
+        """returns (frontmatter, body) if the post needs updating, otherwise None"""
+        full_fn = os.path.join(self.posts_dir, post_fn)
+
+        with codecs.open(full_fn, "r", encoding="utf-8") as ifp:
+            frontmatter, body = read_post(ifp)
+
+        changed = False
+        for img_info in frontmatter.get("images") or []:
+            changed = self.process_image(img_info) or changed
+
+        if changed:
+            return frontmatter, body
+
+        return None
+
+    def __process_safely(self, post_fn):
+        """returns (succeeded, process_post's result)"""
+        try:
+            return True, self.process_post(post_fn)
+        except Exception:
+            logger.exception("unable to reprocess %s", post_fn)
+            return False, None
+
+    def apply(self, updates):
+        """writes and commits {post_fn: (frontmatter, body)} as a single commit, then pushes"""
+        if not updates:
+            return
+
+        with self.git.lock():
+            try:
+                changed_files = []
+                for post_fn, (frontmatter, body) in sorted(updates.items()):
+                    full_fn = os.path.join(self.posts_dir, post_fn)
+
+                    with codecs.open(full_fn, "w", encoding="utf-8") as ofp:
+                        write_post(ofp, frontmatter, body)
+
+                    changed_files.append(full_fn)
+
+                    if self.site_index is not None:
+                        changed_files.extend(self.site_index.update_photos(os.path.relpath(full_fn, self.git.repo_path), frontmatter))
+
+                if self.site_index is not None:
+                    ## Jekyll doesn't know that later rows supersede earlier
+                    ## ones; don't publish stale rows for the photos just updated
+                    self.site_index.photos.compact_if_needed(threshold=1)
+
+                logger.info("updated %d posts", len(updates))
+
+                if self.commit_changes:
+                    self.git.add_file(*OrderedDict.fromkeys(changed_files).keys())
+                    self.git.commit(
+                        self.author_name, self.author_email, formatdate(localtime=True),
+                        u"backfill %d posts" % len(updates),
+                    )
+                else:
+                    logger.warn("not committing changes")
+            except Exception:
+                ## leave the working copy clean for the service
+                if self.commit_changes:
+                    self.git.discard_changes()
+
+                raise
+
+        if self.commit_changes:
+            self.git.push_with_retry()
+
+    def run(self):
+        posts = self.pending_posts()
+        logger.info("%d posts to reprocess", len(posts))
+
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for start in range(0, len(posts), self.batch_size):
+                batch = posts[start:start + self.batch_size]
+                results = zip(batch, executor.map(self.__process_safely, batch))
+
+                self.apply(dict(
+                    (post_fn, result)
+                    for post_fn, (succeeded, result) in results
+                    if succeeded and result is not None
+                ))
+
+                ## never checkpoint past a post that failed, so that resuming retries it
+                if not failed:
+                    done = []
+                    for post_fn, (succeeded, result) in results:
+                        if not succeeded:
+                            break
+
+                        done.append(post_fn)
+
+                    if done:
+                        self.write_checkpoint(done[-1])
+
+                failed.extend(post_fn for post_fn, (succeeded, result) in results if not succeeded)
+
+                if self.pause and start + self.batch_size < len(posts):
+                    time.sleep(self.pause)
+
+        if failed:
+            logger.error("unable to reprocess %d posts, starting with %s; run again to retry", len(failed), failed[0])
+        else:
+            ## finished; the next run starts from the beginning
+            self.clear_checkpoint()
+
+        return failed
@@ -0,0 +1,142 @@
+# -*- encoding: utf-8 -*-
+
+import binascii
+import StringIO
+
+
+class Base64DecodingStream(object):
+    """
+    Read-only, seekable file-like view of a base64-encoded string that is
+    decoded a chunk at a time, so the decoded content never has to exist as a
+    single string.  The first `header_size` decoded bytes are kept around so
+    that the EXIF reader can seek around in the image header cheaply; seeking
+    backwards past that restarts decoding from the beginning.
+    """
+
+    ## number of encoded characters decoded at a time
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, encoded, header_size=128 * 1024):
+        super(Base64DecodingStream, self).__init__()
+
+        self._src = encoded
+        self._header_size = header_size
+        self._header = ""
+
+        ## decoded length, used by requests for the Content-Length header
+        self.len = self.__decoded_length(encoded)
+
+        self.closed = False
+        self._pos = 0
+        self.__reset_decoder()
+
+    @staticmethod
+    def __decoded_length(encoded):
+        chars = len(encoded) - sum(encoded.count(c) for c in " \t\r\n")
+
+        ## padding is at most two characters, possibly followed by whitespace;
+        ## look at the end in place instead of copying the whole string
+        padding = 0
+        pos = len(encoded) - 1
+        while pos >= 0 and padding < 2:
+            if encoded[pos] == "=":
+                padding += 1
+            elif encoded[pos] not in " \t\r\n":
+                break
+
+            pos -= 1
+
+        return chars // 4 * 3 - padding
+
+    def __reset_decoder(self):
+        self._src_pos = 0
+        self._carry = ""
+
+        ## decoded-but-unread bytes; _buf_start is the decoded offset of _buf[_buf_off]
+        self._buf = ""
+        self._buf_off = 0
+        self._buf_start = 0
+
+    def __decode_chunk(self):
+        if self._src_pos >= len(self._src):
+            return False
+
+        ## a2b_base64 wants whole quanta; hang on to any trailing partial one
+        chunk = self._carry + "".join(self._src[self._src_pos:self._src_pos + self.CHUNK_SIZE].split())
+        self._src_pos += self.CHUNK_SIZE
+
+        if self._src_pos < len(self._src):
+            whole = len(chunk) - (len(chunk) % 4)
+            chunk, self._carry = chunk[:whole], chunk[whole:]
+        else:
+            self._carry = ""
+
+        decoded_end = self._buf_start + len(self._buf) - self._buf_off
+
+        self._buf_start = decoded_end
+        self._buf = binascii.a2b_base64(chunk)
+        self._buf_off = 0
+
+        if decoded_end == len(self._header) < self._header_size:
+            self._header += self._buf[:self._header_size - decoded_end]
+
+        return True
+
+    def __seek_decoder(self, pos):
+        if pos < self._buf_start:
+            self.__reset_decoder()
+
+        while pos >= self._buf_start + len(self._buf) - self._buf_off:
+            if not self.__decode_chunk():
+                break
+
+        if pos > self._buf_start:
+            self._buf_off += pos - self._buf_start
+            self._buf_start = pos
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.len - self._pos
+
+        parts = []
+        while size > 0:
+            if self._pos < len(self._header):
+                data = self._header[self._pos:self._pos + size]
+            else:
+                self.__seek_decoder(self._pos)
+
+                data = self._buf[self._buf_off:self._buf_off + size]
+                self._buf_off += len(data)
+                self._buf_start += len(data)
+
+            if not data:
+                break
+
+            self._pos += len(data)
+            size -= len(data)
+            parts.append(data)
+
+        return "".join(parts)
+
+    def seek(self, offset, whence=0):
+        if whence == 1:
+            offset += self._pos
+        elif whence == 2:
+            offset += self.len
+
+        self._pos = max(0, offset)
+
+    def tell(self):
+        return self._pos
+
+    def close(self):
+        self.closed = True
+        self._src = self._buf = self._header = ""
+
+
+def open_part(part):
+    """file-like object for the decoded payload of a MIME part"""
+    if part.get("Content-Transfer-Encoding", "").strip().lower() == "base64":
+        return Base64DecodingStream(part.get_payload())
+
+    return StringIO.StringIO(part.get_payload(decode=True))
@@ -0,0 +1,227 @@
+# -*- encoding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import fcntl
+import json
+import threading
+import time
+from collections import OrderedDict
+from resilience import DeadlineExceededException, RateLimiter
+
+import geopy.location
+
+
+class _Pending(object):
+    """a reverse lookup that's in flight; other callers for the same cluster wait on it"""
+    def __init__(self):
+        super(_Pending, self).__init__()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SharedCache(object):
+    """
+    Small most-recently-added cache of reverse geocoding results in a JSON file,
+    shared by every process using it (each gunicorn worker, and the backfill
+    job) under an exclusive lock.  It's only a cache; an unreadable file is
+    treated as empty.
+    """
+    def __init__(self, path, size=256):
+        super(SharedCache, self).__init__()
+
+        self.path = path
+        self.size = size
+
+    @staticmethod
+    def __key(cluster):
+        return "%r,%r" % cluster
+
+    @staticmethod
+    def __encode(loc):
+        if loc is None:
+            return None
+
+        return OrderedDict([
+            ("address", loc.address),
+            ("latitude", loc.latitude),
+            ("longitude", loc.longitude),
+            ("raw", loc.raw),
+        ])
+
+    @staticmethod
+    def __decode(value):
+        if value is None:
+            return None
+
+        return geopy.location.Location(
+            value["address"],
+            geopy.location.Point(value["latitude"], value["longitude"]),
+            value["raw"],
+        )
+
+    def __read(self, fp):
+        fp.seek(0)
+        data = fp.read()
+
+        try:
+            return json.loads(data, object_pairs_hook=OrderedDict) if data else OrderedDict()
+        except ValueError:
+            logger.warn("ignoring unreadable geocoding cache %s", self.path)
+            return OrderedDict()
+
+    def get(self, cluster):
+        """returns (found, result)"""
+        with open(self.path, "a+") as fp:
+            fcntl.flock(fp, fcntl.LOCK_SH)
+
+            entries = self.__read(fp)
+
+        key = self.__key(cluster)
+        if key not in entries:
+            return False, None
+
+        return True, self.__decode(entries[key])
+
+    def put(self, cluster, loc):
+        with open(self.path, "a+") as fp:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+
+            entries = self.__read(fp)
+
+            key = self.__key(cluster)
+            entries.pop(key, None)
+            entries[key] = self.__encode(loc)
+
+            while len(entries) > self.size:
+                entries.popitem(last=False)
+
+            fp.seek(0)
+            fp.truncate()
+            json.dump(entries, fp)
+            fp.flush()
+
+
+class BatchingGeocoder(object):
+    """
+    Wraps a geopy geocoder so that reverse lookups for points that are close
+    together share a single provider call.  Photos from a burst of emails tend
+    to be clustered, so concurrent and back-to-back requests are rounded to a
+    cluster, de-duplicated and throttled to the provider's rate limit.
+    """
+    def __init__(self, geocoder, precision=3, min_interval=1.0, cache_size=256, rate_file=None, cache_file=None):
+        super(BatchingGeocoder, self).__init__()
+
+        self.geocoder = geocoder
+
+        ## decimal places to round to; 3 is roughly 100m
+        self.precision = precision
+
+        ## minimum seconds between provider calls; shared with other processes
+        ## through rate_file, if given
+        self.rate_limiter = RateLimiter(min_interval, rate_file)
+        self.cache_size = cache_size
+
+        ## results shared with other processes through cache_file, if given;
+        ## the in-process cache and pending map only de-duplicate this worker's
+        ## threads
+        self.shared_cache = None if cache_file is None else SharedCache(cache_file, cache_size)
+
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._cache = OrderedDict()
+
+    def _cluster(self, point):
+        lat, lon = point
+        return (round(lat, self.precision), round(lon, self.precision))
+
+    def __shared_get(self, key):
+        if self.shared_cache is None:
+            return False, None
+
+        try:
+            found, result = self.shared_cache.get(key)
+        except (IOError, OSError), e:
+            logger.warn("unable to read geocoding cache: %r", e)
+            return False, None
+
+        if found:
+            logger.debug("reusing reverse geocoding result for %r from another process", key)
+
+        return found, result
+
+    def __shared_put(self, key, result):
+        if self.shared_cache is None:
+            return
+
+        try:
+            self.shared_cache.put(key, result)
+        except (IOError, OSError), e:
+            logger.warn("unable to update geocoding cache: %r", e)
+
+    def reverse(self, point, exactly_one=True, timeout=None):
+        assert exactly_one, "only single results are supported"
+
+        key = self._cluster(point)
+
+        with self._lock:
+            if key in self._cache:
+                logger.debug("reusing reverse geocoding result for %r", key)
+                return self._cache[key]
+
+            pending = self._pending.get(key)
+            leader = pending is None
+            if leader:
+                pending = self._pending[key] = _Pending()
+
+        if not leader:
+            logger.debug("waiting for in-flight reverse geocoding of %r", key)
+            if not pending.done.wait(timeout):
+                raise DeadlineExceededException("reverse geocoding %r" % (key,))
+
+            if pending.error is not None:
+                raise pending.error
+
+            return pending.result
+
+        end = None if timeout is None else time.time() + timeout
+
+        try:
+            found, pending.result = self.__shared_get(key)
+
+            if not found:
+                ## the rate limit is shared with other processes, so waiting for
+                ## our turn counts against the timeout, too
+                self.rate_limiter.wait(timeout)
+
+                ## another process may have looked it up while we waited our turn
+                found, pending.result = self.__shared_get(key)
+
+            if not found:
+                ## only override the geocoder's own timeout when asked to
+                kwargs = {}
+                if timeout is not None:
+                    kwargs["timeout"] = end - time.time()
+                    if kwargs["timeout"] <= 0:
+                        raise DeadlineExceededException("reverse geocoding %r" % (key,))
+
+                pending.result = self.geocoder.reverse(point, exactly_one=True, **kwargs)
+
+                self.__shared_put(key, pending.result)
+        except Exception, e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._pending[key]
+
+                if pending.error is None:
+                    self._cache[key] = pending.result
+                    while len(self._cache) > self.cache_size:
+                        self._cache.popitem(last=False)
+
+            pending.done.set()
+
+        return pending.result
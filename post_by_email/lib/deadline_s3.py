@@ -0,0 +1,48 @@
+# -*- encoding: utf-8 -*-
+
+import requests
+from tinys3.request_factory import ListRequest, UploadRequest
+
+
+class DeadlineAdapter(object):
+    """
+    Stands in for the requests module in a tinys3 request, giving every HTTP
+    call the time left before the deadline as its timeout.  tinys3 itself never
+    sets one, so a stalled connection would otherwise hang the worker.
+    """
+    def __init__(self, deadline, what):
+        super(DeadlineAdapter, self).__init__()
+
+        self.deadline = deadline
+        self.what = what
+
+    def __call(self, method, *args, **kwargs):
+        kwargs["timeout"] = self.deadline.timeout(what=self.what)
+
+        return getattr(requests, method)(*args, **kwargs)
+
+    def get(self, *args, **kwargs):
+        return self.__call("get", *args, **kwargs)
+
+    def put(self, *args, **kwargs):
+        return self.__call("put", *args, **kwargs)
+
+
+def _with_deadline(request, deadline, what):
+    ## S3Request.adapter() exists so that the transport can be replaced
+    request.adapter = lambda: DeadlineAdapter(deadline, what)
+
+    return request
+
+
+def list_keys(conn, prefix, deadline):
+    """like Connection.list, but with each request limited by the deadline"""
+    return conn.run(_with_deadline(ListRequest(conn, prefix, conn.bucket(None)), deadline, "S3 list"))
+
+
+def upload(conn, key, fp, deadline, content_type=None, close=False, rewind=True):
+    """like Connection.upload, but with the request limited by the deadline"""
+    return conn.run(_with_deadline(
+        UploadRequest(conn, key, fp, conn.bucket(None), content_type=content_type, close=close, rewind=rewind),
+        deadline, "S3 upload",
+    ))
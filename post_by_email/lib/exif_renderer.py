@@ -1,8 +1,7 @@
 # -*- encoding: utf-8 -*-
 
 import exifread
-from datetime import datetime
-from time_util import UTC
+from time_util import UTC, parse_exif_datetime
 
 
 def gps_to_float(ref, values):
@@ -15,11 +14,12 @@ def gps_time_to_datetime(date, timestamp):
     hours, minutes, seconds = [float(v.num) / float(v.den) for v in timestamp.values]
     ts_str = "%s %02d:%02d:%02d" % (date.printable, hours, minutes, seconds)
     
-    return datetime.strptime(ts_str, "%Y:%m:%d %H:%M:%S").replace(tzinfo=UTC)
+    return parse_exif_datetime(ts_str).replace(tzinfo=UTC)
 
 
 def render_stream(stream):
-    return render_tags(exifread.process_file(stream))
+    ## makernotes and thumbnails aren't rendered; skipping them keeps reads within the header
+    return render_tags(exifread.process_file(stream, details=False))
 
 
 def render_tags(exif_tags):
@@ -35,7 +35,7 @@ def render_tags(exif_tags):
             result[rk] = exif_tags[ek].printable
         
     if "EXIF DateTimeOriginal" in exif_tags:
-        result["dateTimeOriginal"] = datetime.strptime(exif_tags["EXIF DateTimeOriginal"].printable, "%Y:%m:%d %H:%M:%S").isoformat()
+        result["dateTimeOriginal"] = parse_exif_datetime(exif_tags["EXIF DateTimeOriginal"].printable).isoformat()
 
     if "GPS GPSDate" in exif_tags and "GPS GPSTimeStamp" in exif_tags:
         result["dateTimeGps"] = gps_time_to_datetime(exif_tags["GPS GPSDate"], exif_tags["GPS GPSTimeStamp"]).isoformat()
@@ -4,18 +4,70 @@ import logging
 logger = logging.getLogger(__name__)
 
 import os
+import signal
 import subprocess
 import tempfile
+import threading
+import time
 from file_lock import file_lock
+from resilience import Deadline, DeadlineExceededException
 from contextlib import contextmanager
 
 
+class PushRejectedException(Exception):
+    """remote refused the push because our branch is behind it"""
+    pass
+
+
+def run(cmd, cwd, timeout=None):
+    """
+    Runs cmd, returning (returncode, combined output).  The process is killed
+    and DeadlineExceededException raised if it runs longer than timeout.
+    """
+    ## in its own process group, so that helpers it spawns (ssh, git-remote-https)
+    ## can be killed with it; otherwise they hold the pipe open after it dies
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, preexec_fn=os.setsid)
+    
+    killed = threading.Event()
+    
+    def kill():
+        killed.set()
+        
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            ## already gone
+            pass
+    
+    timer = None
+    if timeout is not None:
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+    
+    try:
+        output = proc.communicate()[0]
+    finally:
+        if timer is not None:
+            timer.cancel()
+    
+    if killed.is_set():
+        raise DeadlineExceededException(" ".join(cmd))
+    
+    return proc.returncode, output
+
+
 class Git(object):
     """wrapper for git commands"""
-    def __init__(self, repo_url, repo_path):
+    
+    ## output from "git push" that indicates the remote has moved on without us
+    PUSH_REJECTED_MARKERS = ("[rejected]", "non-fast-forward", "fetch first")
+    
+    def __init__(self, repo_url, repo_path, push_retries=5, push_backoff=1):
         super(Git, self).__init__()
         self.repo_url = repo_url
         self.repo_path = repo_path
+        self.push_retries = push_retries
+        self.push_backoff = push_backoff
         self._lock_file = os.path.join(self.repo_path, ".git", "render_post.lock")
 
     def clone(self):
@@ -36,15 +88,20 @@ class Git(object):
         )
     
     @contextmanager
-    def lock(self):
-        with file_lock(self._lock_file):
+    def lock(self, wait=30):
+        ## only local operations happen while this is held, so it's reasonable
+        ## to wait for another worker to finish instead of failing outright
+        with file_lock(self._lock_file, wait=wait):
             logger.debug("acquired lock")
             yield
 
-    def clean_sweep(self):
-        logger.info("cleaning")
+    def reset_to_origin(self):
+        """
+        Drops local commits and changes, leaving master where origin/master
+        was at the last fetch; caller must hold the lock.
+        """
+        logger.warn("resetting to origin/master")
         
-        subprocess.check_call(["git", "fetch"], cwd=self.repo_path)
         subprocess.check_call(
             [
                 "git", "reset",
@@ -60,13 +117,65 @@ class Git(object):
             cwd=self.repo_path,
         )
 
-    def add_file(self, path):
-        logger.info("adding %s", path)
+    def discard_changes(self):
+        """
+        Throws away uncommitted changes, leaving committed but unpushed work
+        alone; caller must hold the lock.
+        """
+        logger.warn("discarding uncommitted changes")
+        
+        subprocess.check_call(
+            [
+                "git", "reset",
+                "--quiet",
+                "--hard", "HEAD",
+            ],
+            cwd=self.repo_path,
+        )
+        
+        subprocess.check_call(
+            ["git", "clean", "-f", "-d"],
+            cwd=self.repo_path,
+        )
+
+    def exists_upstream(self, path):
+        """true if path, relative to the repo, exists in origin/master as of the last fetch"""
+        with open(os.devnull, "w") as devnull:
+            return subprocess.call(
+                ["git", "cat-file", "-e", "origin/master:" + path],
+                cwd=self.repo_path,
+                stderr=devnull,
+            ) == 0
+
+    def add_file(self, *paths):
+        logger.info("adding %s", ", ".join(paths))
         
         subprocess.check_call(
-            ["git", "add", path],
+            ["git", "add"] + list(paths),
             cwd=self.repo_path,
         )
+    
+    def use_union_merge(self, patterns):
+        """
+        Resolves conflicting changes to the given (append-only) files by keeping
+        the lines from both sides, so rebasing concurrent appends never fails.
+        Configured in .git/info/attributes so the blog repo itself is untouched.
+        """
+        attrs_fn = os.path.join(self.repo_path, ".git", "info", "attributes")
+        
+        existing = []
+        if os.path.exists(attrs_fn):
+            with open(attrs_fn, "r") as ifp:
+                existing = ifp.read().splitlines()
+        
+        missing = ["%s merge=union" % p for p in patterns if "%s merge=union" % p not in existing]
+        if missing:
+            if not os.path.exists(os.path.dirname(attrs_fn)):
+                os.makedirs(os.path.dirname(attrs_fn))
+            
+            with open(attrs_fn, "a") as ofp:
+                for line in missing:
+                    ofp.write(line + "\n")
 
     def commit(self, author_name, author_email, date, message):
         logger.info("committing")
@@ -97,12 +206,84 @@ class Git(object):
                 },
             )
     
-    def push(self):
+    def fetch(self, timeout=None):
+        logger.info("fetching")
+        
+        cmd = ["git", "fetch", "--quiet"]
+        returncode, output = run(cmd, self.repo_path, timeout)
+        
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, cmd, output)
+    
+    def rebase(self):
+        """replay local commits on top of origin/master; caller must hold the lock"""
+        logger.info("rebasing onto origin/master")
+        
+        try:
+            subprocess.check_call(
+                ["git", "rebase", "--quiet", "origin/master"],
+                cwd=self.repo_path,
+            )
+        except subprocess.CalledProcessError:
+            logger.error("rebase failed; aborting")
+            
+            subprocess.call(["git", "rebase", "--abort"], cwd=self.repo_path)
+            raise
+    
+    def push(self, timeout=None):
         logger.info("pushing")
         
-        subprocess.check_call(
-            [
-                "git", "push", "--quiet"
-            ],
-            cwd=self.repo_path,
-        )
+        cmd = ["git", "push", "--quiet", "--porcelain", "origin", "master"]
+        returncode, output = run(cmd, self.repo_path, timeout)
+        
+        if returncode != 0:
+            if any(m in output for m in self.PUSH_REJECTED_MARKERS):
+                raise PushRejectedException(output)
+            
+            raise subprocess.CalledProcessError(returncode, cmd, output)
+    
+    def push_with_retry(self, deadline=None):
+        """
+        Pushes optimistically.  If the remote has moved on, fetches, rebases our
+        commits on top of it and tries again, backing off between attempts.
+        Network calls happen without the lock; only the rebase holds it.  Gives
+        up with DeadlineExceededException if the deadline passes first.
+        
+        If the push can't be completed, local commits are dropped so that the
+        next push isn't stuck behind them, and the error is re-raised.  That
+        includes other workers' unpushed commits; callers should confirm their
+        change made it with exists_upstream().
+        """
+        if deadline is None:
+            deadline = Deadline()
+        
+        try:
+            self.__push_with_retry(deadline)
+        except Exception:
+            logger.exception("unable to push")
+            
+            with self.lock():
+                self.reset_to_origin()
+            
+            raise
+    
+    def __push_with_retry(self, deadline):
+        attempt = 0
+        while True:
+            try:
+                self.push(timeout=deadline.timeout(what="git push"))
+                return
+            except PushRejectedException:
+                attempt += 1
+                if attempt > self.push_retries:
+                    logger.error("push still rejected after %d retries", self.push_retries)
+                    raise
+                
+                delay = deadline.timeout(self.push_backoff * (2 ** (attempt - 1)), what="git push")
+                logger.warn("push rejected; rebasing and retrying in %ds (%d/%d)", delay, attempt, self.push_retries)
+                time.sleep(delay)
+            
+            self.fetch(timeout=deadline.timeout(what="git fetch"))
+            
+            with self.lock(wait=deadline.timeout(30, what="git lock")):
+                self.rebase()
@@ -0,0 +1,66 @@
+# -*- encoding: utf-8 -*-
+
+## reading and writing Jekyll posts in the format EmailHandler generates
+
+import rtyaml as yaml
+from collections import OrderedDict
+
+
+class PostFormatException(Exception):
+    pass
+
+
+def write_post(ofp, frontmatter, body):
+    """writes the post to ofp, which must accept unicode (eg. from codecs.open)"""
+    fm = OrderedDict(frontmatter)
+
+    ## I *want* to use yaml, but I can't get it to properly to encode
+    ## "Test 🔫"; kept getting "Test \uD83D\uDD2B" which the Go yaml parser
+    ## bitched about.
+    ## but I'm not hitched to hugo, yet, and yaml is what jekyll uses, so…
+    ofp.write("---\n")
+
+    ## hack for title which the yaml generator won't do properly
+    ofp.write('title: "%s"\n' % fm.pop("title"))
+    yaml.dump(fm, ofp)
+
+    ## we want an space between the frontmatter and the body
+    ofp.write("---\n\n")
+    ofp.write(body)
+
+
+def read_post(ifp):
+    """
+    Inverse of write_post; ifp must return unicode.  Returns the frontmatter,
+    with the title first, and the body.
+    """
+    if ifp.readline() != u"---\n":
+        raise PostFormatException("missing frontmatter")
+
+    title = None
+    fm_lines = []
+    while True:
+        line = ifp.readline()
+        if not line:
+            raise PostFormatException("unterminated frontmatter")
+
+        if line == u"---\n":
+            break
+
+        ## the title's written by hand, and isn't necessarily valid yaml
+        if title is None and line.startswith(u'title: "') and line.endswith(u'"\n'):
+            title = line[len(u'title: "'):-len(u'"\n')]
+        else:
+            fm_lines.append(line)
+
+    frontmatter = OrderedDict()
+    if title is not None:
+        frontmatter["title"] = title
+
+    frontmatter.update(yaml.load(u"".join(fm_lines)) or {})
+
+    body = ifp.read()
+    if body.startswith(u"\n"):
+        body = body[1:]
+
+    return frontmatter, body
@@ -0,0 +1,228 @@
+# -*- encoding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import errno
+import fcntl
+import threading
+import time
+
+
+class DeadlineExceededException(Exception):
+    pass
+
+
+class CircuitOpenException(Exception):
+    pass
+
+
+class Deadline(object):
+    """point in time by which a request must be finished; None means no limit"""
+    def __init__(self, seconds=None):
+        super(Deadline, self).__init__()
+
+        self.expires = None if seconds is None else time.time() + seconds
+
+    def remaining(self):
+        """seconds left, or None if unbounded"""
+        if self.expires is None:
+            return None
+
+        return max(0, self.expires - time.time())
+
+    def check(self, what="request"):
+        if self.remaining() == 0:
+            raise DeadlineExceededException(what)
+
+    def timeout(self, cap=None, what="request"):
+        """
+        Timeout to use for a call: the time remaining, limited to `cap`.  None
+        if neither is set.  Raises DeadlineExceededException if already expired.
+        """
+        self.check(what)
+
+        remaining = self.remaining()
+        if remaining is None:
+            return cap
+
+        return remaining if cap is None else min(remaining, cap)
+
+
+class DeadlineReader(object):
+    """
+    Wraps a file-like upload body so that reading from it fails once the
+    deadline has passed, aborting an upload that can't be given a timeout.
+    """
+    def __init__(self, fp, deadline, what="upload"):
+        super(DeadlineReader, self).__init__()
+
+        self.fp = fp
+        self.deadline = deadline
+        self.what = what
+
+        if hasattr(fp, "len"):
+            self.len = fp.len
+
+    def read(self, *args):
+        self.deadline.check(self.what)
+
+        return self.fp.read(*args)
+
+    def seek(self, *args):
+        return self.fp.seek(*args)
+
+    def tell(self):
+        return self.fp.tell()
+
+    def close(self):
+        return self.fp.close()
+
+
+class RateLimiter(object):
+    """
+    Spaces calls at least `min_interval` seconds apart, across threads.  With
+    `state_file`, the time of the last call is kept there under an exclusive
+    lock so that the interval also holds across every process sharing it.
+    """
+
+    ## seconds between attempts to take a lock when waiting is limited
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, min_interval, state_file=None):
+        super(RateLimiter, self).__init__()
+
+        self.min_interval = min_interval
+        self.state_file = state_file
+
+        self._lock = threading.Lock()
+        self._last_call = 0
+
+    def __acquire(self, try_acquire, end):
+        while not try_acquire():
+            if time.time() >= end:
+                raise DeadlineExceededException("waiting for rate limit")
+
+            time.sleep(self.POLL_INTERVAL)
+
+    def __lock_thread(self, end):
+        if end is None:
+            self._lock.acquire()
+        else:
+            self.__acquire(lambda: self._lock.acquire(False), end)
+
+    def __lock_file(self, fp, end):
+        if end is None:
+            fcntl.flock(fp, fcntl.LOCK_EX)
+            return
+
+        def try_flock():
+            try:
+                fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return True
+            except IOError, e:
+                if e.errno not in (errno.EWOULDBLOCK, errno.EAGAIN):
+                    raise
+
+                return False
+
+        self.__acquire(try_flock, end)
+
+    def __wait_until(self, last_call, end):
+        delay = last_call + self.min_interval - time.time()
+        if delay > 0:
+            if end is not None and time.time() + delay > end:
+                raise DeadlineExceededException("waiting for rate limit")
+
+            time.sleep(delay)
+
+        return time.time()
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the next call may be made.  Raises DeadlineExceededException
+        instead if that would take more than `timeout` seconds.
+        """
+        end = None if timeout is None else time.time() + timeout
+
+        self.__lock_thread(end)
+        try:
+            if self.state_file is None:
+                self._last_call = self.__wait_until(self._last_call, end)
+                return
+
+            with open(self.state_file, "a+") as fp:
+                ## other processes block here while we sleep, which is the point
+                self.__lock_file(fp, end)
+
+                try:
+                    fp.seek(0)
+                    last_call = float(fp.read().strip() or 0)
+                except ValueError:
+                    last_call = 0
+
+                self._last_call = self.__wait_until(last_call, end)
+
+                fp.seek(0)
+                fp.truncate()
+                fp.write(repr(self._last_call))
+                fp.flush()
+        finally:
+            self._lock.release()
+
+
+class CircuitBreaker(object):
+    """
+    Stops calling a dependency after `failure_threshold` consecutive failures.
+    After `reset_timeout` seconds one trial call is let through; success closes
+    the circuit again, failure keeps it open for another `reset_timeout`.
+
+    Used as a context manager around calls to the dependency.
+    """
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        super(CircuitBreaker, self).__init__()
+
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def is_open(self):
+        with self._lock:
+            return self._opened_at is not None and time.time() - self._opened_at < self.reset_timeout
+
+    def __enter__(self):
+        with self._lock:
+            if self._opened_at is not None:
+                if time.time() - self._opened_at < self.reset_timeout:
+                    raise CircuitOpenException(self.name)
+
+                ## half-open; let this call through, and hold off everyone else until it's done
+                logger.info("circuit for %s half-open; trying again", self.name)
+                self._opened_at = time.time()
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        with self._lock:
+            if exc_type is None:
+                if self._opened_at is not None:
+                    logger.info("circuit for %s closed", self.name)
+
+                self._failures = 0
+                self._opened_at = None
+            else:
+                self._failures += 1
+
+                if self._failures >= self.failure_threshold:
+                    if self._opened_at is None:
+                        logger.error("circuit for %s opened after %d failures", self.name, self._failures)
+
+                    self._opened_at = time.time()
+
+        ## don't swallow the exception
+        return False
@@ -0,0 +1,213 @@
+# -*- encoding: utf-8 -*-
+
+import logging
+logger = logging.getLogger(__name__)
+
+import os
+import csv
+from collections import OrderedDict
+
+
+class DataIndex(object):
+    """
+    Append-only CSV file in the Jekyll _data directory.  New rows are appended
+    so each post only touches the end of the file (and concurrent appends merge
+    cleanly with git's union merge driver); rows with the same key supersede
+    earlier ones and are dropped when the file is compacted.
+    """
+    def __init__(self, path, fields, key_fields, compact_threshold=50):
+        super(DataIndex, self).__init__()
+
+        self.path = path
+        self.fields = fields
+        self.key_fields = key_fields
+
+        ## compact once this many rows have been superseded
+        self.compact_threshold = compact_threshold
+
+        ## keys seen and rows superseded, so appending doesn't mean rereading
+        ## the file; reloaded whenever the file's size isn't what we last left
+        ## it at (eg. after a rebase, or an append from another process).  the
+        ## count only decides when to compact, so an occasional miss is harmless.
+        self._keys = None
+        self._superseded = 0
+        self._size = None
+
+    def __key(self, row):
+        return tuple(row[f] for f in self.key_fields)
+
+    def __encoded_key(self, values):
+        return tuple(values[self.fields.index(f)] for f in self.key_fields)
+
+    def __file_size(self):
+        return os.path.getsize(self.path) if os.path.exists(self.path) else None
+
+    def __load_counts(self):
+        size = self.__file_size()
+        if self._keys is not None and size == self._size:
+            return
+
+        self._keys = set()
+        self._superseded = 0
+        for row in self.read():
+            self.__count(self.__encode(row))
+
+        self._size = size
+
+    def __count(self, values):
+        key = self.__encoded_key(values)
+        if key in self._keys:
+            self._superseded += 1
+        else:
+            self._keys.add(key)
+
+    def __encode(self, row):
+        values = []
+        for f in self.fields:
+            value = row.get(f)
+            values.append((u"" if value is None else unicode(value)).encode("utf-8"))
+
+        return values
+
+    def read(self):
+        """returns all rows, including superseded ones, in file order"""
+        if not os.path.exists(self.path):
+            return []
+
+        rows = []
+        with open(self.path, "rb") as ifp:
+            for values in csv.reader(ifp):
+                ## skip the header, and any extra copies of it left by a merge
+                if values == self.fields:
+                    continue
+
+                rows.append(OrderedDict(zip(self.fields, [v.decode("utf-8") for v in values])))
+
+        return rows
+
+    def append(self, rows):
+        if not os.path.exists(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path))
+
+        self.__load_counts()
+
+        is_new = not os.path.exists(self.path)
+
+        with open(self.path, "ab") as ofp:
+            writer = csv.writer(ofp, lineterminator="\n")
+
+            if is_new:
+                writer.writerow(self.fields)
+
+            for row in rows:
+                values = self.__encode(row)
+                writer.writerow(values)
+                self.__count(values)
+
+        self._size = self.__file_size()
+
+        self.compact_if_needed()
+
+    def compact_if_needed(self, threshold=None):
+        """compacts if at least `threshold` (default compact_threshold) rows have been superseded"""
+        self.__load_counts()
+
+        if self._superseded >= (self.compact_threshold if threshold is None else threshold):
+            self.compact()
+
+    def compact(self, rows=None):
+        """rewrites the file with only the latest row for each key"""
+        if rows is None:
+            rows = self.read()
+
+        latest = OrderedDict()
+        for row in rows:
+            key = self.__key(row)
+
+            ## keep the position of the most recent version
+            latest.pop(key, None)
+            latest[key] = row
+
+        logger.info("compacting %s: %d rows -> %d", self.path, len(rows), len(latest))
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as ofp:
+            writer = csv.writer(ofp, lineterminator="\n")
+            writer.writerow(self.fields)
+
+            for row in latest.values():
+                writer.writerow(self.__encode(row))
+
+        os.rename(tmp_path, self.path)
+
+        self._keys = set(self.__encoded_key(self.__encode(row)) for row in latest.values())
+        self._superseded = 0
+        self._size = self.__file_size()
+
+
+class SiteIndex(object):
+    """
+    Maintains machine-readable indexes of posts under _data so the site can
+    build photo galleries, maps and tag pages without re-reading every post.
+    """
+
+    ## files the indexes live in, relative to the repo; for configuring merges
+    PATTERNS = ["_data/photos.csv", "_data/tags.csv"]
+
+    def __init__(self, repo_path, compact_threshold=50):
+        super(SiteIndex, self).__init__()
+
+        data_dir = os.path.join(repo_path, "_data")
+
+        self.photos = DataIndex(
+            os.path.join(data_dir, "photos.csv"),
+            ["path", "post", "date", "dateTimeOriginal", "latitude", "longitude", "name"],
+            ["path"],
+            compact_threshold,
+        )
+
+        self.tags = DataIndex(
+            os.path.join(data_dir, "tags.csv"),
+            ["tag", "post", "date"],
+            ["tag", "post"],
+            compact_threshold,
+        )
+
+    @staticmethod
+    def photo_row(post, date, img_info):
+        exif = img_info.get("exif", {})
+        location = exif.get("location", {})
+
+        return {
+            "path": img_info["path"],
+            "post": post,
+            "date": date,
+            "dateTimeOriginal": exif.get("dateTimeOriginal"),
+            "latitude": repr(location["latitude"]) if "latitude" in location else None,
+            "longitude": repr(location["longitude"]) if "longitude" in location else None,
+            "name": location.get("name"),
+        }
+
+    def update_photos(self, post, frontmatter):
+        """
+        Records a post's images, superseding any earlier rows for them.
+        Returns the full paths of the index files that changed.
+        """
+        if not frontmatter.get("images"):
+            return []
+
+        self.photos.append([self.photo_row(post, frontmatter["date"], img) for img in frontmatter["images"]])
+        return [self.photos.path]
+
+    def add_post(self, post, frontmatter):
+        """
+        Records a post's images and tags; `post` is the post's path relative
+        to the repo.  Returns the full paths of the index files that changed.
+        """
+        changed = self.update_photos(post, frontmatter)
+
+        if frontmatter.get("tags"):
+            self.tags.append([{"tag": t, "post": post, "date": frontmatter["date"]} for t in frontmatter["tags"]])
+            changed.append(self.tags.path)
+
+        return changed
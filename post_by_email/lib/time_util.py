@@ -3,6 +3,7 @@
 import datetime
 import email.utils
 import calendar
+import re
 
 
 ZERO = datetime.timedelta(0)
@@ -44,8 +45,28 @@ class FixedOffset(datetime.tzinfo):
 
 UTC = FixedOffset(ZERO, "UTC")
 
+## FixedOffset instances, keyed by offset in seconds
+_FIXED_OFFSETS = {}
 
-def parse_date(date_str):
+
+def fixed_offset(seconds):
+    """returns a shared FixedOffset for the given UTC offset in seconds"""
+    tz = _FIXED_OFFSETS.get(seconds)
+    if tz is None:
+        tz = _FIXED_OFFSETS.setdefault(seconds, FixedOffset(datetime.timedelta(seconds=seconds)))
+    
+    return tz
+
+
+## the overwhelmingly common "[Sun, ]5 Jul 2015 07:28:43 -0400 [(EDT)]" form of RFC 2822
+RFC2822_RE = re.compile(
+    r"""^\s*(?:[A-Za-z]{3},\s*)?(\d{1,2})\s+([A-Za-z]{3})\s+(\d{4})\s+(\d{2}):(\d{2})(?::(\d{2}))?\s+([-+])(\d{2})(\d{2})(?:\s*\([^)]*\))?\s*$"""
+)
+
+MONTHS = dict((m, i + 1) for i, m in enumerate(["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]))
+
+
+def _parse_date_email_utils(date_str):
     ## timezones in python continue to be a shit-show
     ## returns datetime in the original zone
     ## http://stackoverflow.com/a/23117071/53051
@@ -55,6 +76,43 @@ def parse_date(date_str):
     timestamp = calendar.timegm(tt) - tt[9]
     naive_utc_dt = datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=timestamp)
     aware_utc_dt = naive_utc_dt.replace(tzinfo=UTC)
-    aware_dt = aware_utc_dt.astimezone(FixedOffset(datetime.timedelta(seconds=tt[9])))
+    aware_dt = aware_utc_dt.astimezone(fixed_offset(tt[9]))
     
     return aware_dt
+
+
+def parse_date(date_str):
+    """parses an RFC 2822 date; returns datetime in the original zone"""
+    match = RFC2822_RE.match(date_str)
+    if match:
+        day, month, year, hour, minute, second, sign, tz_hours, tz_minutes = match.groups()
+        
+        offset = int(tz_hours) * 3600 + int(tz_minutes) * 60
+        if sign == "-":
+            offset = -offset
+        
+        try:
+            return datetime.datetime(
+                int(year), MONTHS[month.lower()], int(day),
+                int(hour), int(minute), int(second or 0),
+                tzinfo=fixed_offset(offset),
+            )
+        except (KeyError, ValueError):
+            ## unknown month or out-of-range field; let email.utils sort it out
+            pass
+    
+    return _parse_date_email_utils(date_str)
+
+
+def parse_exif_datetime(value):
+    """parses the fixed "%Y:%m:%d %H:%M:%S" format used by EXIF without strptime"""
+    if len(value) == 19 and value[4] == value[7] == value[13] == value[16] == ":" and value[10] == " ":
+        try:
+            return datetime.datetime(
+                int(value[0:4]), int(value[5:7]), int(value[8:10]),
+                int(value[11:13]), int(value[14:16]), int(value[17:19]),
+            )
+        except ValueError:
+            pass
+    
+    return datetime.datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+
+## fills in missing location names (and optionally re-renders EXIF) for existing
+## posts.  safe to run alongside the service; interrupt and re-run to resume.
+
+import logging
+logging.basicConfig(format="%(asctime)s [%(levelname)s] %(message)s", level=logging.INFO)
+
+import argparse
+import sys
+
+import geopy
+import tinys3
+
+import config
+from lib.git import Git
+from lib.batching_geocoder import BatchingGeocoder
+from lib.site_index import SiteIndex
+from lib.backfill import Backfill
+
+
+def main():
+    parser = argparse.ArgumentParser(description="reprocess existing posts")
+    parser.add_argument("--refresh-exif", action="store_true", help="re-render EXIF from the images in S3")
+    parser.add_argument("--workers", type=int, default=4, help="posts processed in parallel")
+    parser.add_argument("--batch-size", type=int, default=20, help="posts per commit")
+    parser.add_argument("--pause", type=float, default=5, help="seconds between batches")
+    parser.add_argument("--geocode-interval", type=float, default=config.OPENCAGE_MIN_INTERVAL * 2, help="seconds between this job's geocoding requests")
+    parser.add_argument("--s3-interval", type=float, default=0.1, help="seconds between S3 requests")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint from an earlier run")
+    args = parser.parse_args()
+
+    git = Git(config.GIT_REPO, config.GIT_WORKING_COPY)
+    s3 = tinys3.Connection(
+        config.AWS_ACCESS_KEY_ID,
+        config.AWS_SECRET_ACCESS_KEY,
+        default_bucket=config.S3_IMAGE_BUCKET,
+        tls=True,
+    )
+
+    ## the rate file is shared with the service, so together they never exceed
+    ## OPENCAGE_MIN_INTERVAL; a longer interval here leaves most of that for
+    ## live ingestion
+    geocoder = BatchingGeocoder(
+        geopy.geocoders.OpenCage(config.OPENCAGE_API_KEY, timeout=5),
+        precision=config.GEOCODE_PRECISION,
+        min_interval=max(args.geocode_interval, config.OPENCAGE_MIN_INTERVAL),
+        rate_file=config.OPENCAGE_RATE_FILE,
+        cache_file=config.OPENCAGE_CACHE_FILE,
+    )
+
+    site_index = None
+    if config.UPDATE_SITE_INDEX:
+        site_index = SiteIndex(config.GIT_WORKING_COPY)
+        git.use_union_merge(SiteIndex.PATTERNS)
+
+    backfill = Backfill(
+        s3, geocoder, git,
+        commit_changes=config.COMMIT_CHANGES,
+        site_index=site_index,
+        refresh_exif=args.refresh_exif,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        s3_interval=args.s3_interval,
+        pause=args.pause,
+        author_name=config.GIT_COMMITTER_NAME,
+        author_email=config.GIT_COMMITTER_EMAIL,
+    )
+
+    if args.restart:
+        backfill.clear_checkpoint()
+
+    ## posts that failed are left for the next run
+    if backfill.run():
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -15,5 +15,5 @@ exec gunicorn \
     --bind :5000 \
     --timeout 180 \
     --access-logfile /var/log/post-by-email/access.log \
-    --workers 2 \
+    --config gunicorn_config.py \
     FlaskApp:app